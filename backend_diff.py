@@ -0,0 +1,308 @@
+import io
+import copy
+import argparse
+import contextlib
+
+import numpy as np
+import cnst
+
+import reference_backend as ref
+import robot_utils
+import vine_robot_utils
+from batch_utils import grid_lookup, wall_collisions, robot_collisions, sense_cells, footprint_sense_cells
+from reachability_utils import inflate_obstacles
+from mdp_utils import vine_line
+from map_gen_utils import generate_map
+from terrain_utils import create_terrain
+from rl_env_utils import move_robots
+from domain_utils import propose, BUMP_ANGLES
+from voxel_utils import extrude_levels, create_voxel_store, sense_voxels, get_voxels
+
+# differential harness: the frozen reference in reference_backend.py against every fast or
+# cached backend, on random generated maps, poses and seeds
+# each check returns one record per backend it compared: cells / poses compared and how many
+# differed, plus the map seed and trial of the first failures so they can be replayed
+# poses are drawn uniformly, on exact half cells (where int(round()) rounds to even) and on
+# integer cells, and a little outside the map
+# the batch movers (rl_env_utils.move_robots, domain_utils.propose) take the jitter and bump
+# order the reference drew, read back from the reference's own moves (reference_draws)
+# new backends add a check function to CHECKS
+
+POSE_TOL = 1e-9
+
+
+def record(backend, cells=0, cell_errors=0, poses=0, pose_errors=0, max_pose_error=0.0):
+    return {'backend': backend, 'cells': cells, 'cell_errors': cell_errors, 'poses': poses,
+            'pose_errors': pose_errors, 'max_pose_error': max_pose_error}
+
+def random_positions(rng, shape, n):
+    kind = rng.integers(0, 3, size=n)
+    positions = rng.uniform(-2, np.array(shape) + 2, size=(n, 2))
+    positions[kind == 1] = np.floor(positions[kind == 1]) + 0.5
+    positions[kind == 2] = np.floor(positions[kind == 2])
+    return positions
+
+def random_floor_plan(rng):
+    grid_size = (int(rng.integers(20, 80)), int(rng.integers(20, 100)))
+    return np.asarray(generate_map({'grid_size': grid_size}, seed=int(rng.integers(1 << 30))), dtype=float)
+
+def free_robots(rng, floor_plan, n, sensors):
+    # robots the reference says do not collide with the walls or each other
+    robots = []
+    for _ in range(50 * n):
+        if len(robots) == n:
+            break
+        position = tuple(rng.uniform(0, floor_plan.shape))
+        if not ref.check_collision(position, None, robots, floor_plan, cnst.ROBOT_DIAM):
+            robots.append(robot_utils.create_robot(position, float(rng.uniform(0, 2 * np.pi)), sensors))
+    return robots
+
+def check_collision(rng, floor_plan, n=300):
+    positions = random_positions(rng, floor_plan.shape, n)
+    others = random_positions(rng, floor_plan.shape, 5)
+    robots = [{'position': tuple(p)} for p in others]
+    expected = np.array([ref.check_collision(tuple(p), None, robots, floor_plan, cnst.ROBOT_DIAM) for p in positions])
+
+    live = np.array([robot_utils.check_collision(tuple(p), None, robots, floor_plan, cnst.ROBOT_DIAM) for p in positions])
+    batch = (wall_collisions(positions, cnst.ROBOT_DIAM / 2, floor_plan.shape, grid_lookup(floor_plan))
+             | robot_collisions(positions, others, cnst.ROBOT_DIAM))
+    return [record('robot_utils.check_collision', poses=n, pose_errors=int(np.sum(live != expected))),
+            record('batch_utils.wall_collisions', poses=n, pose_errors=int(np.sum(batch != expected)))]
+
+def check_reachability(rng, floor_plan):
+    # the configuration space claims to match check_collision exactly at integer positions
+    blocked = inflate_obstacles(floor_plan == 0, cnst.ROBOT_DIAM)
+    expected = np.array([[ref.check_collision((x, y), None, [], floor_plan, cnst.ROBOT_DIAM)
+                          for y in range(floor_plan.shape[1])] for x in range(floor_plan.shape[0])])
+    return [record('reachability_utils.inflate_obstacles', cells=blocked.size, cell_errors=int(np.sum(blocked != expected)))]
+
+def reference_sense(robot, floor_plan, heat_source_position):
+    known_map = -1 * np.ones(floor_plan.shape)
+    known_heat_map = -1 * np.ones(floor_plan.shape)
+    _, cone_points_list, _ = ref.sense_environment([robot], floor_plan, known_map, True, heat_source_position,
+                                                   known_heat_map, cnst.ROBOT_DIAM, cnst.CONE_ANGLE, cnst.CONE_LENGTH)
+    return known_map, known_heat_map, np.reshape(cone_points_list[0], (-1, 2))
+
+def point_errors(points, expected):
+    if len(points) != len(expected):
+        return 1, np.inf
+    error = float(np.max(np.abs(points - expected))) if len(points) else 0.0
+    return int(error > POSE_TOL), error
+
+def check_sense(rng, floor_plan, n=20):
+    heat_source_position = tuple(rng.uniform(0, floor_plan.shape))
+    records = {name: record(name) for name in ('robot_utils.sense_environment', 'batch_utils.sense_cells',
+                                               'batch_utils.footprint_sense_cells')}
+    for position, orientation in zip(random_positions(rng, floor_plan.shape, n), rng.uniform(0, 2 * np.pi, n)):
+        for sensors in ({'Cone Vision': True, 'Heat Sensor': True}, {'Heat Sensor': True}):
+            robot = robot_utils.create_robot(tuple(position), float(orientation), sensors)
+            expected, expected_heat, expected_points = reference_sense(robot, floor_plan, heat_source_position)
+
+            # twice at the same pose, the second call is served from the robot's sensed_key cache
+            known_map = -1 * np.ones(floor_plan.shape)
+            known_heat_map = -1 * np.ones(floor_plan.shape)
+            live = records['robot_utils.sense_environment']
+            for _ in range(2):
+                _, cone_points_list, _ = robot_utils.sense_environment([robot], floor_plan, known_map, True,
+                                                                       heat_source_position, known_heat_map)
+                live['cells'] += 2 * floor_plan.size
+                live['cell_errors'] += int(np.sum(known_map != expected) + np.sum(~np.isclose(known_heat_map, expected_heat)))
+                errors, error = point_errors(np.reshape(cone_points_list[0], (-1, 2)), expected_points)
+                live['poses'] += 1
+                live['pose_errors'] += errors
+                live['max_pose_error'] = max(live['max_pose_error'], error)
+
+            # the batch kernels do occupancy only
+            known_map = -1 * np.ones(floor_plan.shape)
+            if sensors.get('Cone Vision'):
+                batch = records['batch_utils.sense_cells']
+                cells, values, _, points = sense_cells(position[None], [orientation], floor_plan.shape, grid_lookup(floor_plan))
+                errors, error = point_errors(points, expected_points)
+                batch['poses'] += 1
+                batch['pose_errors'] += errors
+                batch['max_pose_error'] = max(batch['max_pose_error'], error)
+            else:
+                batch = records['batch_utils.footprint_sense_cells']
+                cells, values, _ = footprint_sense_cells(position[None], floor_plan.shape, grid_lookup(floor_plan))
+            known_map[cells[:, 0], cells[:, 1]] = values
+            batch['cells'] += floor_plan.size
+            batch['cell_errors'] += int(np.sum(known_map != expected))
+    return list(records.values())
+
+def check_move(rng, floor_plan, n_robots=8, n_steps=30, scheduler=None, terrain=None, backend='robot_utils.move_robot'):
+    # same np.random seed through the reference and the live move_robot, poses compared every step
+    robots = free_robots(rng, floor_plan, n_robots, {})
+    live_robots = copy.deepcopy(robots)
+    seed = int(rng.integers(1 << 31))
+    result = record(backend)
+
+    state = np.random.get_state()
+    np.random.seed(seed)
+    reference_poses = []
+    for _ in range(n_steps):
+        ref.move_robot(robots, floor_plan, cnst.ROBOT_DIAM)
+        reference_poses.append([robot['position'] + (robot['orientation'],) for robot in robots])
+    np.random.seed(seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for step in range(n_steps):
+            robot_utils.move_robot(live_robots, floor_plan, scheduler, terrain)
+            error = np.abs(np.array([robot['position'] + (robot['orientation'],) for robot in live_robots])
+                           - np.array(reference_poses[step])).reshape(-1, 3)
+            result['poses'] += len(error)
+            result['pose_errors'] += int(np.sum(np.max(error, axis=1) > POSE_TOL))
+            result['max_pose_error'] = max(result['max_pose_error'], float(error.max()) if error.size else 0.0)
+    np.random.set_state(state)
+    return [result]
+
+def check_scheduler(rng, floor_plan):
+    # a crowd so robots get boxed in and sleep, patience 1 tests boxed_in on every failed step;
+    # all flat terrain moves like no terrain and runs the terrain paths too
+    return check_move(rng, floor_plan, n_robots=200, n_steps=40,
+                      scheduler=robot_utils.create_scheduler(sleep_steps=10, patience=1),
+                      terrain=create_terrain(floor_plan), backend='robot_utils.move_robot+scheduler')
+
+def reference_draws(before, after, seed):
+    # jitter and bump order (indices into BUMP_ANGLES) a reference move_robot seeded with seed
+    # drew, replayed from its outcome: a robot that went straight ahead drew no bump order
+    np.random.seed(seed)
+    jitter, order = np.zeros(len(before)), np.tile(np.arange(3), (len(before), 1))
+    for i, (robot, moved) in enumerate(zip(before, after)):
+        jitter[i] = np.random.uniform(-np.pi / 18, np.pi / 18)
+        orientation = (robot['orientation'] + jitter[i]) % (2 * np.pi)
+        if moved['position'] == robot['position'] or moved['orientation'] != orientation:
+            rotation_angles = [np.pi / 2, -np.pi / 2, np.pi]
+            np.random.shuffle(rotation_angles)
+            order[i] = [list(BUMP_ANGLES).index(angle) for angle in rotation_angles]
+    return jitter, order
+
+def pose_record(result, positions, orientations, robots):
+    error = np.abs(np.column_stack([positions, orientations])
+                   - np.array([robot['position'] + (robot['orientation'],) for robot in robots]))
+    result['poses'] += len(error)
+    result['pose_errors'] += int(np.sum(np.max(error, axis=1) > POSE_TOL))
+    result['max_pose_error'] = max(result['max_pose_error'], float(error.max()) if error.size else 0.0)
+
+def check_batch_move(rng, floor_plan, n_robots=8, n_steps=30):
+    # rl_env_utils.move_robots moves in list order like the reference, so it is stepped with the
+    # reference's draws; domain_utils.propose checks every robot against start positions, which
+    # is the reference with that robot moved first
+    robots = free_robots(rng, floor_plan, n_robots, {})
+    n = len(robots)
+    rl, domain = record('rl_env_utils.move_robots'), record('domain_utils.propose')
+    env = {'rng': None, 'n_envs': 1, 'n_robots': n, 'shape': floor_plan.shape, 'floor_plans': floor_plan[None],
+           'distance_traveled': np.zeros((1, n))}
+    state = np.random.get_state()
+    for _ in range(n_steps):
+        positions = np.array([robot['position'] for robot in robots]).reshape(-1, 2)
+        orientations = np.array([robot['orientation'] for robot in robots])
+
+        jitter, order = np.zeros(n), np.zeros((n, 3), dtype=int)
+        first_moves = []
+        for i in range(n):
+            seed = int(rng.integers(1 << 31))
+            moved = copy.deepcopy([robots[i]] + robots[:i] + robots[i + 1:])
+            np.random.seed(seed)
+            ref.move_robot(moved, floor_plan, cnst.ROBOT_DIAM)
+            first_moves.append(moved[0])
+            robot_jitter, robot_order = reference_draws([robots[i]], moved[:1], seed)
+            jitter[i], order[i] = robot_jitter[0], robot_order[0]
+        ids = np.arange(n)
+        choice, choice_orientation, _ = propose(floor_plan, positions, orientations, ids, ids, jitter, order, cnst.ROBOT_DIAM)
+        pose_record(domain, choice, choice_orientation, first_moves)
+
+        seed = int(rng.integers(1 << 31))
+        moved = copy.deepcopy(robots)
+        np.random.seed(seed)
+        ref.move_robot(moved, floor_plan, cnst.ROBOT_DIAM)
+        jitter, order = reference_draws(robots, moved, seed)
+        env['positions'] = positions[None].copy()
+        move_robots(env, orientations[None], jitter[None], order[None])
+        pose_record(rl, env['positions'][0], env['orientations'][0], moved)
+        robots = moved
+    np.random.set_state(state)
+    return [rl, domain]
+
+def check_sense_3d(rng, floor_plan, n=20, n_rays=16, n_steps=16):
+    # one pitch ray per yaw at mid wall height on a one level site sees what sense_cells sees
+    env = extrude_levels([floor_plan], level_height=6)
+    z = 3.0
+    result = record('voxel_utils.sense_voxels')
+    for position, orientation in zip(random_positions(rng, floor_plan.shape, n), rng.uniform(0, 2 * np.pi, n)):
+        known_map = -1 * np.ones(floor_plan.shape)
+        cells, values, _, _ = sense_cells(position[None], [orientation], floor_plan.shape, grid_lookup(floor_plan),
+                                          n_rays=n_rays, n_steps=n_steps)
+        known_map[cells[:, 0], cells[:, 1]] = values
+        known = create_voxel_store(env['shape'], -1)
+        sense_voxels([(position[0], position[1], z)], [orientation], [0.0], env, known,
+                     n_yaw=n_rays, n_pitch=1, n_steps=n_steps)
+        voxels = get_voxels(known, tuple(np.indices(env['shape']).reshape(3, -1))).reshape(env['shape'])
+        expected = -1 * np.ones(env['shape'])
+        expected[:, :, int(z)] = known_map
+        result['cells'] += voxels.size
+        result['cell_errors'] += int(np.sum(voxels != expected))
+    return [result]
+
+def check_vine(rng, floor_plan):
+    start = tuple(rng.uniform(0, floor_plan.shape))
+    orientation = float(rng.uniform(0, 2 * np.pi))
+    reference_vine = {'positions': [start], 'orientation': orientation, 'active': True}
+    while reference_vine['active']:
+        ref.move_vine_robot(reference_vine, floor_plan)
+    expected = np.array(reference_vine['positions'])
+
+    live_vine = {'positions': [start], 'orientation': orientation, 'active': True}
+    with contextlib.redirect_stdout(io.StringIO()):
+        while live_vine['active']:
+            vine_robot_utils.move_vine_robot(live_vine, floor_plan)
+
+    records = []
+    for name, positions in (('vine_robot_utils.move_vine_robot', live_vine['positions']),
+                            ('mdp_utils.vine_line', vine_line(floor_plan, start, orientation))):
+        errors, error = point_errors(np.array(positions), expected)
+        records.append(record(name, poses=1, pose_errors=errors, max_pose_error=error))
+    return records
+
+CHECKS = {
+    'collision': check_collision,
+    'reachability': check_reachability,
+    'sense': check_sense,
+    'move': check_move,
+    'scheduler': check_scheduler,
+    'batch_move': check_batch_move,
+    'sense_3d': check_sense_3d,
+    'vine': check_vine,
+}
+
+def run_harness(n_maps=10, seed=0, checks=None):
+    rng = np.random.default_rng(seed)
+    summary, failures = {}, []
+    for map_index in range(n_maps):
+        floor_plan = random_floor_plan(rng)
+        for name in (checks or CHECKS):
+            for rec in CHECKS[name](rng, floor_plan):
+                total = summary.setdefault(rec['backend'], record(rec['backend']))
+                for key in ('cells', 'cell_errors', 'poses', 'pose_errors'):
+                    total[key] += rec[key]
+                total['max_pose_error'] = max(total['max_pose_error'], rec['max_pose_error'])
+                if rec['cell_errors'] or rec['pose_errors']:
+                    failures.append({'seed': seed, 'map': map_index, 'check': name, **rec})
+    return {'backends': list(summary.values()), 'failures': failures}
+
+def print_report(report):
+    print(f"{'backend':40s} {'cells':>9s} {'cell err':>9s} {'poses':>7s} {'pose err':>9s} {'max pose err':>13s}")
+    for rec in report['backends']:
+        print(f"{rec['backend']:40s} {rec['cells']:9d} {rec['cell_errors']:9d} {rec['poses']:7d} "
+              f"{rec['pose_errors']:9d} {rec['max_pose_error']:13.3g}")
+    for failure in report['failures'][:10]:
+        print(f"  FAIL seed {failure['seed']} map {failure['map']} {failure['check']}: {failure['backend']}")
+    print("OK" if not report['failures'] else f"{len(report['failures'])} failing comparisons")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="compare fast backends against the frozen reference")
+    parser.add_argument('--maps', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--checks', nargs='*', choices=sorted(CHECKS))
+    args = parser.parse_args()
+    report = run_harness(args.maps, args.seed, args.checks)
+    print_report(report)
+    raise SystemExit(1 if report['failures'] else 0)
@@ -0,0 +1,114 @@
+import numpy as np
+import cnst
+
+# batched versions of the robot_utils kernels: many robots (and many environments) per numpy call
+# cells are int index arrays with the coordinate on the last axis, so the same code runs on
+# 2D grids and on 3D voxel stores; occupancy comes in through an is_wall(coords, rows) callable
+# that gets a tuple of per-axis in-bounds index arrays and the robot row of each (broadcastable)
+# rounding follows robot_utils: int(round(v)) == np.rint(v), both round half to even
+
+
+def in_bounds(cells, shape):
+    inside = np.ones(cells.shape[:-1], dtype=bool)
+    for d, size in enumerate(shape):
+        inside &= (cells[..., d] >= 0) & (cells[..., d] < size)
+    return inside
+
+def grid_lookup(grids, env_index=None):
+    # is_wall for a (H, W) grid, or a (B, H, W) stack where env_index[row] picks the grid
+    def is_wall(coords, rows):
+        if env_index is None:
+            return grids[coords] == 0
+        return grids[(env_index[rows],) + tuple(coords)] == 0
+    return is_wall
+
+def footprint_cells(positions, radius):
+    # every cell check_collision looks at for each position: (M, C, D) cells, (M, C) used mask,
+    # (M, C) distance from the position to the cell centre
+    positions = np.asarray(positions, dtype=float)
+    n_dims = positions.shape[-1]
+    lo = np.floor(positions - radius).astype(int)
+    hi = np.ceil(positions + radius).astype(int)
+    width = int(np.ceil(2 * radius)) + 2
+    grid = np.stack(np.meshgrid(*([np.arange(width)] * n_dims), indexing='ij'), axis=-1).reshape(-1, n_dims)
+    cells = lo[:, None, :] + grid[None, :, :]
+    used = np.all(cells <= hi[:, None, :], axis=-1)
+    dist = np.sqrt(np.sum((cells + 0.5 - positions[:, None, :]) ** 2, axis=-1))
+    return cells, used, dist
+
+def wall_collisions(positions, radius, shape, is_wall):
+    # check_collision's wall part: any used cell outside the map, or a wall cell centre inside the robot
+    cells, used, dist = footprint_cells(positions, radius)
+    inside = in_bounds(cells, shape)
+    out_of_bounds = np.any(used & ~inside, axis=1)
+
+    check = used & inside & (dist < radius)
+    walls = np.zeros(check.shape, dtype=bool)
+    rows, cols = np.nonzero(check)
+    walls[rows, cols] = is_wall(tuple(cells[rows, cols].T), rows)
+    return out_of_bounds | np.any(walls, axis=1)
+
+def robot_collisions(positions, others, robot_diameter, exclude=None):
+    # positions (M, D) against others (K, D); exclude[m] = index into others to skip (itself)
+    dist = np.sqrt(np.sum((positions[:, None, :] - others[None, :, :]) ** 2, axis=-1))
+    hit = dist < robot_diameter
+    if exclude is not None:
+        valid = exclude >= 0
+        hit[np.flatnonzero(valid), exclude[valid]] = False
+    return np.any(hit, axis=1)
+
+def cone_directions(orientations, cone_angle=None, n_rays=100):
+    # (M, R, 2) unit vectors of sense_environment's fan of rays
+    cone_angle = cnst.CONE_ANGLE if cone_angle is None else cone_angle
+    angles = np.asarray(orientations)[:, None] + np.linspace(-cone_angle / 2, cone_angle / 2, n_rays)[None, :]
+    return np.stack([np.cos(angles), np.sin(angles)], axis=-1)
+
+def cast_rays(origins, directions, distances, shape, is_wall):
+    # samples origin + d * direction along each ray; out-of-bounds samples are skipped, the first
+    # wall sample is seen and ends the ray, as in sense_environment
+    # works one axis at a time on (M, R, S) arrays, interleaving the coordinates is far slower
+    # returns the per-axis sample points and cells, the seen mask and which seen samples are walls
+    points = tuple(origins[:, d, None, None] + directions[:, :, d, None] * distances
+                   for d in range(len(shape)))
+    cells = tuple(np.rint(p).astype(np.intp) for p in points)
+    inside = np.ones(points[0].shape, dtype=bool)
+    for c, size in zip(cells, shape):
+        inside &= (c >= 0) & (c < size)
+
+    # look every sample up at a clipped cell and mask afterwards, cheaper than gathering the inside ones
+    clipped = tuple(np.clip(c, 0, size - 1) for c, size in zip(cells, shape))
+    wall = is_wall(clipped, np.arange(len(origins))[:, None, None]) & inside
+
+    # samples up to and including the first wall on each ray
+    first_wall = np.where(wall.any(axis=-1), wall.argmax(axis=-1), len(distances))
+    seen = inside & (np.arange(len(distances)) <= first_wall[..., None])
+    return points, cells, seen, wall & seen
+
+def sense_cells(positions, orientations, shape, is_wall, cone_angle=None, cone_length=None,
+                n_rays=100, n_steps=50):
+    # cone vision for many robots: (K, D) seen cells, (K,) values (0 wall, 1 free), (K,) robot row
+    # and the (K, D) seen sample points (sense_environment's cone_points)
+    cone_length = cnst.CONE_LENGTH if cone_length is None else cone_length
+    positions = np.asarray(positions, dtype=float)
+    directions = cone_directions(orientations, cone_angle, n_rays)
+    distances = np.linspace(0.5, cone_length, n_steps)
+    points, cells, seen, wall = cast_rays(positions, directions, distances, shape, is_wall)
+    rows = np.nonzero(seen)[0]
+    seen_cells = np.stack([c[seen] for c in cells], axis=-1)
+    seen_points = np.stack([p[seen] for p in points], axis=-1)
+    return seen_cells, np.where(wall[seen], 0, 1), rows, seen_points
+
+def footprint_sense_cells(positions, shape, is_wall, robot_diameter=None):
+    # sensing without cone vision: cells whose centre is within the robot radius
+    robot_diameter = cnst.ROBOT_DIAM if robot_diameter is None else robot_diameter
+    cells, used, dist = footprint_cells(positions, robot_diameter / 2)
+    seen = used & in_bounds(cells, shape) & (dist <= robot_diameter / 2)
+    rows, cols = np.nonzero(seen)
+    return cells[rows, cols], np.where(is_wall(tuple(cells[rows, cols].T), rows), 0, 1), rows
+
+def heat_field(shape, heat_source_position):
+    # get_heat_at_position for every cell at once
+    x, y = np.indices(shape)
+    sigma = max(shape) / 5
+    distance_sq = (x - heat_source_position[0]) ** 2 + (y - heat_source_position[1]) ** 2
+    return np.exp(-distance_sq / (2 * sigma ** 2))
@@ -0,0 +1,198 @@
+import numpy as np
+import cnst
+
+from batch_utils import footprint_sense_cells, grid_lookup
+
+# distributed sensing: every robot keeps its own known map and robots only learn from each
+# other when they are within comm_range
+# each node appends the cells it learns (sensed or received) to a log, so "what changed since
+# we last met" is a slice of that log and an exchange costs what is new, not the map size
+# node 0 is the base station at the vine tip, what reaches it is what the operator knows;
+# the team map is the union of every log, merged incrementally from per-node cursors
+
+BASE = 0
+
+
+def create_comm(shape, comm_range, capacity=16):
+    n_cells = int(np.prod(shape))
+    return {
+        'shape': tuple(shape),
+        'comm_range': comm_range,
+        'n': 1,  # the base
+        'maps': [np.full(n_cells, -1, dtype=np.int8)],
+        'logs': [new_log()],
+        'last_pose': [None],
+        'sent': np.zeros((capacity, capacity), dtype=np.int64),  # sent[i, j]: log i entries j has seen
+        'merged': np.zeros(capacity, dtype=np.int64),             # log entries in the team map
+        'team_map': np.full(n_cells, -1, dtype=np.int8),
+        'team_known': 0,
+        'team_free': 0,
+        'exchanges': 0,
+        'cells_sent': 0,
+        'bytes_sent': 0,
+    }
+
+def new_log(capacity=256):
+    return {'cells': np.zeros(capacity, dtype=np.int64), 'values': np.zeros(capacity, dtype=np.int8), 'n': 0}
+
+def register_robots(comm, robots):
+    # robot i is node i + 1, robots are only ever appended
+    n_new = len(robots) + 1
+    if n_new <= comm['n']: return
+    capacity = len(comm['merged'])
+    if n_new > capacity:
+        capacity = max(n_new, 2 * capacity)
+        sent = np.zeros((capacity, capacity), dtype=np.int64)
+        sent[:comm['n'], :comm['n']] = comm['sent'][:comm['n'], :comm['n']]
+        merged = np.zeros(capacity, dtype=np.int64)
+        merged[:comm['n']] = comm['merged'][:comm['n']]
+        comm['sent'], comm['merged'] = sent, merged
+    n_cells = len(comm['team_map'])
+    for _ in range(comm['n'], n_new):
+        comm['maps'].append(np.full(n_cells, -1, dtype=np.int8))
+        comm['logs'].append(new_log())
+        comm['last_pose'].append(None)
+    comm['n'] = n_new
+
+def learn(comm, node, cells, values):
+    # write flat cells into a node's map, log the ones it did not know yet
+    local = comm['maps'][node]
+    new = local[cells] == -1
+    cells, first = np.unique(cells[new], return_index=True)
+    values = values[new][first]
+    if len(cells) == 0:
+        return 0
+    local[cells] = values
+
+    log = comm['logs'][node]
+    n, n_new = log['n'], log['n'] + len(cells)
+    if n_new > len(log['cells']):
+        capacity = max(n_new, 2 * len(log['cells']))
+        for key in ('cells', 'values'):
+            grown = np.zeros(capacity, dtype=log[key].dtype)
+            grown[:n] = log[key][:n]
+            log[key] = grown
+    log['cells'][n:n_new] = cells
+    log['values'][n:n_new] = values
+    log['n'] = n_new
+    return len(cells)
+
+def log_since(comm, node, start):
+    log = comm['logs'][node]
+    return log['cells'][start:log['n']], log['values'][start:log['n']]
+
+def encode_delta(cells, values):
+    # sorted flat cells as either runs (start, length, value) or a coordinate list with the
+    # values packed one bit each, whichever is smaller; walls and open floor both come in
+    # runs along a row, scattered cone tips do not
+    order = np.argsort(cells, kind='stable')
+    cells, values = cells[order], values[order]
+    n = len(cells)
+    breaks = np.flatnonzero((np.diff(cells) != 1) | (np.diff(values) != 0)) + 1
+    starts = np.concatenate([[0], breaks]) if n else np.zeros(0, dtype=int)
+
+    rle_bytes = 9 * len(starts)                  # uint32 start, uint32 length, int8 value
+    sparse_bytes = 4 * n + (n + 7) // 8
+    if rle_bytes < sparse_bytes:
+        lengths = np.diff(np.concatenate([starts, [n]]))
+        return {'kind': 'rle', 'starts': cells[starts].astype(np.uint32), 'lengths': lengths.astype(np.uint32),
+                'values': values[starts], 'bytes': rle_bytes}
+    return {'kind': 'sparse', 'cells': cells.astype(np.uint32), 'bits': np.packbits(values == 1),
+            'n': n, 'bytes': sparse_bytes}
+
+def decode_delta(delta):
+    if delta['kind'] == 'rle':
+        lengths = delta['lengths'].astype(np.int64)
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        cells = np.repeat(delta['starts'].astype(np.int64), lengths) + offsets
+        return cells, np.repeat(delta['values'], lengths)
+    values = np.unpackbits(delta['bits'], count=delta['n']).astype(np.int8)
+    return delta['cells'].astype(np.int64), values
+
+def outgoing(comm, src, dst):
+    # what src has learned since it last sent to dst, encoded, or None
+    cells, values = log_since(comm, src, comm['sent'][src, dst])
+    if len(cells) == 0:
+        return None
+    delta = encode_delta(cells, values)
+    comm['cells_sent'] += len(cells)
+    comm['bytes_sent'] += delta['bytes']
+    return delta
+
+def exchange(comm, i, j):
+    # both deltas are taken before either side learns, so what one sends is not echoed back
+    # in the other's reply; afterwards each log is seen whole, its new tail came from the peer
+    to_j, to_i = outgoing(comm, i, j), outgoing(comm, j, i)
+    if to_j is not None:
+        learn(comm, j, *decode_delta(to_j))
+    if to_i is not None:
+        learn(comm, i, *decode_delta(to_i))
+    comm['sent'][i, j] = comm['logs'][i]['n']
+    comm['sent'][j, i] = comm['logs'][j]['n']
+    comm['exchanges'] += 1
+
+def in_range_pairs(comm, positions):
+    # node pairs closer than comm_range, nodes with no position (base before the vine) are skipped
+    nodes = np.array([k for k, p in enumerate(positions) if p is not None])
+    if len(nodes) < 2:
+        return []
+    xy = np.array([positions[k] for k in nodes], dtype=float)
+    dist = np.sqrt(np.sum((xy[:, None, :] - xy[None, :, :]) ** 2, axis=-1))
+    a, b = np.nonzero(np.triu(dist < comm['comm_range'], k=1))
+    return list(zip(nodes[a], nodes[b]))
+
+def sensed_cells(robot, floor_plan, cone_points):
+    # the cells sense_environment just wrote for this robot, from its cone points or footprint
+    if robot['sensors'].get('Cone Vision', False):
+        cells = np.rint(np.reshape(cone_points, (-1, 2))).astype(int)
+        return cells, floor_plan[cells[:, 0], cells[:, 1]].astype(np.int8)
+    cells, values, _ = footprint_sense_cells(np.array([robot['position']]), floor_plan.shape,
+                                             grid_lookup(floor_plan), cnst.ROBOT_DIAM)
+    return cells, values.astype(np.int8)
+
+def merge_team(comm):
+    # fold every log entry the team map has not seen yet into it
+    team_map = comm['team_map']
+    for node in range(comm['n']):
+        cells, values = log_since(comm, node, comm['merged'][node])
+        comm['merged'][node] = comm['logs'][node]['n']
+        new = team_map[cells] == -1
+        cells, first = np.unique(cells[new], return_index=True)
+        team_map[cells] = values[new][first]
+        comm['team_known'] += len(cells)
+        comm['team_free'] += int(np.count_nonzero(values[new][first] == 1))
+
+def update_comm(comm, robots, floor_plan, cone_points_list, base_position=None):
+    # once per step after sense_environment
+    register_robots(comm, robots)
+    for i, (robot, cone_points) in enumerate(zip(robots, cone_points_list)):
+        pose = (robot['position'], robot['orientation'])
+        if comm['last_pose'][i + 1] == pose:
+            continue  # same cells as last step
+        comm['last_pose'][i + 1] = pose
+        cells, values = sensed_cells(robot, floor_plan, cone_points)
+        if len(cells):
+            learn(comm, i + 1, np.ravel_multi_index(cells.T, comm['shape']), values)
+
+    positions = [base_position] + [robot['position'] for robot in robots]
+    for i, j in in_range_pairs(comm, positions):
+        exchange(comm, i, j)
+    merge_team(comm)
+
+def local_map(comm, node):
+    return comm['maps'][node].reshape(comm['shape'])
+
+def comm_results(comm, floor_plan):
+    free_cells = np.count_nonzero(floor_plan == 1)
+    n_cells = len(comm['team_map'])
+    local_known = [int(comm['logs'][node]['n']) for node in range(1, comm['n'])]
+    base_free = int(np.count_nonzero(comm['maps'][BASE] == 1))
+    return {
+        'team_coverage': comm['team_known'] / n_cells,
+        'team_free_coverage': comm['team_free'] / free_cells if free_cells else 0.0,
+        'base_free_coverage': base_free / free_cells if free_cells else 0.0,
+        'robot_coverage': [known / n_cells for known in local_known],
+        'exchanges': int(comm['exchanges']),
+        'cells_sent': int(comm['cells_sent']),
+        'bytes_sent': int(comm['bytes_sent']),
+    }
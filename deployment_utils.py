@@ -0,0 +1,106 @@
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import cnst
+
+from sim_utils import create_simulation, run_simulation, sensor_dict
+from snapshot_utils import snapshot, restore
+
+# drop schedule search for the vine robot (RQ2: how does deployment affect operational range)
+# a schedule is a sorted tuple of (drop step, sensor set) drops; candidates are scored with
+# short headless rollouts and cut by successive halving: every rung runs the survivors a bit
+# longer and keeps the best 1 / eta of them
+# two schedules with the same drops before step T are in the same state at T (same seed,
+# later drops do not touch the RNG until they happen), so each rung simulates every distinct
+# prefix once and resumes it from the previous rung's snapshot instead of from step 0
+
+
+def candidate_schedules(team_sizes=(1, 2, 3), drop_steps=range(0, 100, 10), sensor_sets=None,
+                        n_candidates=64, seed=0):
+    # random distinct schedules, or all of them if there are fewer than n_candidates
+    if sensor_sets is None:
+        sensor_sets = [combo
+                       for n in range(1, len(cnst.SENSOR_OPT) + 1)
+                       for combo in itertools.combinations(cnst.SENSOR_OPT, n)]
+    sensor_sets = [tuple(sensors) for sensors in sensor_sets]
+    drop_steps = list(drop_steps)
+
+    rng = np.random.default_rng(seed)
+    schedules = set()
+    for _ in range(20 * n_candidates):
+        if len(schedules) >= n_candidates:
+            break
+        n = int(rng.choice(team_sizes))
+        steps = np.sort(rng.choice(drop_steps, size=n))
+        sets = [sensor_sets[i] for i in rng.integers(0, len(sensor_sets), size=n)]
+        schedules.add(tuple(sorted(zip((int(step) for step in steps), sets))))
+    return sorted(schedules)
+
+def prefix(schedule, step):
+    return tuple(drop for drop in schedule if drop[0] < step)
+
+def advance(snap, drops, to_step):
+    # resume a prefix, queue the drops that happen before to_step and run up to it
+    sim = restore(snap)
+    sim['pending_drops'] = sim['pending_drops'] + [(drop_step, sensor_dict(sensors)) for drop_step, sensors in drops]
+    results = run_simulation(sim, to_step)
+    return results, snapshot(sim)
+
+def default_objective(results):
+    return results['free_coverage']
+
+def plan_deployment(vine_start, vine_orientation, candidates=None, base_scenario=None,
+                    rungs=(25, 50, 100, 200), eta=2, objective=None, processes=1):
+    # drops at or after the last rung are never simulated, keep candidate drop steps below it
+    objective = default_objective if objective is None else objective
+    scenario = dict(base_scenario or {})
+    scenario.update({'vine_start': tuple(vine_start), 'vine_orientation': vine_orientation, 'team': [], 'drop_steps': []})
+    alive = candidate_schedules() if candidates is None else [tuple(sorted((int(s), tuple(sensors)) for s, sensors in c))
+                                                             for c in candidates]
+    alive = sorted(set(alive))
+
+    start = snapshot(create_simulation(scenario))
+    cache = {}  # (prefix, step) -> (results, snapshot)
+    scores = {}
+    rollouts, steps_simulated = 0, 0
+    pool = ProcessPoolExecutor(max_workers=processes) if processes != 1 else None
+
+    previous = 0
+    for rung, step in enumerate(rungs):
+        tasks = {}
+        for schedule in alive:
+            key = (prefix(schedule, step), step)
+            if key in tasks:
+                continue
+            snap = start if previous == 0 else cache[(prefix(schedule, previous), previous)][1]
+            tasks[key] = (snap, [drop for drop in schedule if previous <= drop[0] < step], step)
+
+        keys = list(tasks)
+        if pool is None:
+            done = [advance(*tasks[key]) for key in keys]
+        else:
+            done = list(pool.map(advance, *zip(*(tasks[key] for key in keys))))
+        # only this rung's prefixes are resumed from, drop the older snapshots
+        cache = dict(zip(keys, done))
+        rollouts += len(keys)
+        steps_simulated += len(keys) * (step - previous)
+
+        for schedule in alive:
+            scores[schedule] = (objective(cache[(prefix(schedule, step), step)][0]), step)
+        alive.sort(key=lambda schedule: -scores[schedule][0])
+        if rung < len(rungs) - 1:
+            alive = alive[:max(1, int(np.ceil(len(alive) / eta)))]
+        previous = step
+
+    if pool is not None:
+        pool.shutdown()
+
+    ranking = sorted(scores, key=lambda schedule: (-scores[schedule][1], -scores[schedule][0]))
+    return {
+        'ranking': [{'schedule': [(drop_step, list(sensors)) for drop_step, sensors in schedule],
+                     'score': float(scores[schedule][0]), 'steps': scores[schedule][1]} for schedule in ranking],
+        'best_results': cache[(prefix(alive[0], previous), previous)][0],
+        'rollouts': rollouts,
+        'steps_simulated': steps_simulated,
+    }
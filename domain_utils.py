@@ -0,0 +1,216 @@
+import numpy as np
+from multiprocessing import Process, Barrier, shared_memory
+from multiprocessing.connection import wait
+from scipy.spatial import cKDTree
+import cnst
+
+from batch_utils import grid_lookup, wall_collisions, cone_directions, cast_rays
+from reachability_utils import get_reachability
+
+# huge swarms on huge maps: the robots are split into x slabs, one worker process per slab
+# every array lives in shared memory, a worker only writes its own robots and reads the
+# others within a halo of its slab, two barriers per step:
+#   1. sense + propose: each robot picks the first free of forward / shuffled bump turns
+#      against the walls and every robot's position at the start of the step
+#   2. resolve + commit: a move is cancelled if it overlaps the move of a lower id robot,
+#      staying put is always safe since every move was checked against start positions
+# this is a synchronous version of move_robot (it moves robots one after another, which no
+# split can reproduce); jitter and bump order come from a per-step stream indexed by robot
+# id, so the result depends on the seed only and not on the number of workers
+# slabs are re-cut every step at robot x quantiles so each worker gets the same share
+# a failing worker breaks the barrier so the others stop too, and the parent aborts it when
+# any worker dies; BARRIER_TIMEOUT is only a backstop for a parent that went away
+
+JITTER = np.pi / 18
+BUMP_ANGLES = np.array([np.pi / 2, -np.pi / 2, np.pi])
+BARRIER_TIMEOUT = 600.0  # seconds a worker waits for the others at one barrier
+JOIN_TIMEOUT = 10.0  # seconds a worker gets to exit after a failure before it is terminated
+
+
+def spawn_swarm(floor_plan, n_robots, seed=0, robot_diameter=None):
+    # random free configuration cells on a lattice one diameter apart, so nobody starts overlapping
+    robot_diameter = cnst.ROBOT_DIAM if robot_diameter is None else robot_diameter
+    rng = np.random.default_rng(seed)
+    spacing = int(np.ceil(robot_diameter))
+    free_cells = np.argwhere(get_reachability(floor_plan, robot_diameter)['free'])
+    free_cells = free_cells[np.all(free_cells % spacing == 0, axis=1)]
+    if n_robots > len(free_cells):
+        raise ValueError(f"only room for {len(free_cells)} robots")
+    positions = free_cells[rng.choice(len(free_cells), size=n_robots, replace=False)].astype(float)
+    return positions, rng.uniform(0, 2 * np.pi, size=n_robots)
+
+def step_noise(seed, step, n_robots):
+    rng = np.random.default_rng([seed, step])
+    jitter = rng.uniform(-JITTER, JITTER, size=n_robots)
+    order = rng.permuted(np.tile(np.arange(3), (n_robots, 1)), axis=1)
+    return jitter, order
+
+def slab(positions, worker, n_workers, halo):
+    # robots this worker owns, and the ids of every robot within halo of its slab
+    order = np.argsort(positions[:, 0], kind='stable')
+    n = len(positions)
+    owned = np.sort(order[worker * n // n_workers:(worker + 1) * n // n_workers])
+    if len(owned) == 0:
+        return owned, owned
+    x = positions[:, 0]
+    near = np.flatnonzero((x >= x[owned].min() - halo) & (x <= x[owned].max() + halo))
+    return owned, near
+
+def sense(floor_plan, known_map, positions, orientations, ids, n_rays, n_steps):
+    # cone vision for ids into the shared known map; every writer writes the true cell value,
+    # so overlapping cones from different workers agree
+    if len(ids) == 0:
+        return
+    directions = cone_directions(orientations[ids], n_rays=n_rays)
+    distances = np.linspace(0.5, cnst.CONE_LENGTH, n_steps)
+    _, cells, seen, wall = cast_rays(positions[ids], directions, distances, floor_plan.shape, grid_lookup(floor_plan))
+    known_map[cells[0][seen], cells[1][seen]] = ~wall[seen]
+
+def propose(floor_plan, positions, orientations, owned, near, jitter, order, robot_diameter):
+    # first free candidate per owned robot, against walls and start positions of near robots
+    orientation = (orientations[owned] + jitter[owned]) % (2 * np.pi)
+    candidates = np.concatenate([orientation[:, None], (orientation[:, None] + BUMP_ANGLES[order[owned]]) % (2 * np.pi)], axis=1)
+    targets = positions[owned, None, :] + np.stack([np.cos(candidates), np.sin(candidates)], axis=-1)
+
+    free = ~wall_collisions(targets.reshape(-1, 2), robot_diameter / 2, floor_plan.shape,
+                            grid_lookup(floor_plan)).reshape(len(owned), 4)
+    pairs = cKDTree(targets.reshape(-1, 2)).sparse_distance_matrix(cKDTree(positions[near]), robot_diameter, output_type='ndarray')
+    pairs = pairs[(pairs['v'] < robot_diameter) & (near[pairs['j']] != owned[pairs['i'] // 4])]
+    free.reshape(-1)[pairs['i']] = False
+
+    moved = free.any(axis=1)
+    first = np.argmax(free, axis=1)
+    rows = np.arange(len(owned))
+    choice = np.where(moved[:, None], targets[rows, first], positions[owned])
+    return choice, np.where(moved, candidates[rows, first], orientation), moved
+
+def resolve(choices, moving, owned, near, robot_diameter):
+    # cancel owned moves that overlap the move of a lower id robot
+    movers = near[moving[near]]
+    mine = owned[moving[owned]]
+    if len(mine) == 0 or len(movers) == 0:
+        return mine
+    pairs = cKDTree(choices[mine]).sparse_distance_matrix(cKDTree(choices[movers]), robot_diameter, output_type='ndarray')
+    pairs = pairs[(pairs['v'] < robot_diameter) & (movers[pairs['j']] < mine[pairs['i']])]
+    return np.setdiff1d(mine, mine[pairs['i']])
+
+def step_slab(buffers, step, worker, n_workers, seed, barrier, n_rays, n_steps, robot_diameter):
+    floor_plan, known_map = buffers['floor_plan'], buffers['known_map']
+    positions, orientations = buffers['positions'][step % 2], buffers['orientations'][step % 2]
+    halo = robot_diameter + 2  # one step each plus a diameter
+    owned, near = slab(positions, worker, n_workers, halo)
+    jitter, order = step_noise(seed, step, len(positions))
+
+    sense(floor_plan, known_map, positions, orientations, owned, n_rays, n_steps)
+    choice, choice_orientation, moved = propose(floor_plan, positions, orientations, owned, near, jitter, order, robot_diameter)
+    buffers['choices'][owned] = choice
+    buffers['moving'][owned] = moved
+    if barrier is not None:
+        barrier.wait()
+
+    accepted = resolve(buffers['choices'], buffers['moving'], owned, near, robot_diameter)
+    next_positions, next_orientations = buffers['positions'][(step + 1) % 2], buffers['orientations'][(step + 1) % 2]
+    next_positions[owned] = positions[owned]
+    next_positions[accepted] = buffers['choices'][accepted]
+    next_orientations[owned] = choice_orientation
+    buffers['distance'][accepted] += 1.0
+    if barrier is not None:
+        barrier.wait()
+
+BUFFER_SPECS = {
+    # name: (shape from (map shape, n robots), dtype)
+    'floor_plan': (lambda shape, n: shape, np.int8),
+    'known_map': (lambda shape, n: shape, np.int8),
+    'positions': (lambda shape, n: (2, n, 2), np.float64),
+    'orientations': (lambda shape, n: (2, n), np.float64),
+    'choices': (lambda shape, n: (n, 2), np.float64),
+    'moving': (lambda shape, n: (n,), np.bool_),
+    'distance': (lambda shape, n: (n,), np.float64),
+}
+
+def attach(names, shape, n_robots):
+    blocks, buffers = [], {}
+    for key, (size, dtype) in BUFFER_SPECS.items():
+        block = shared_memory.SharedMemory(name=names[key])
+        blocks.append(block)
+        buffers[key] = np.ndarray(size(shape, n_robots), dtype=dtype, buffer=block.buf)
+    return blocks, buffers
+
+def worker_loop(names, shape, n_robots, worker, n_workers, seed, barrier, n_steps_run, n_rays, n_steps, robot_diameter):
+    blocks, buffers = attach(names, shape, n_robots)
+    try:
+        for step in range(n_steps_run):
+            step_slab(buffers, step, worker, n_workers, seed, barrier, n_rays, n_steps, robot_diameter)
+    except BaseException:
+        # release the workers waiting on us
+        barrier.abort()
+        raise
+    finally:
+        del buffers
+        for block in blocks:
+            block.close()
+
+def join_workers(workers, barrier):
+    # wait for every worker; once one fails (even killed, so it never aborted the barrier)
+    # abort it for the rest, and terminate whoever has not exited in JOIN_TIMEOUT
+    running = list(workers)
+    while running:
+        wait([worker.sentinel for worker in running])
+        running = [worker for worker in running if worker.is_alive()]
+        if any(worker.exitcode for worker in workers):
+            barrier.abort()
+            break
+    for worker in running:
+        worker.join(JOIN_TIMEOUT)
+        if worker.is_alive():
+            worker.terminate()
+            worker.join()
+
+def run_domains(floor_plan, positions, orientations, n_steps_run, n_workers=1, seed=0,
+                n_rays=16, n_steps=None, robot_diameter=None):
+    # returns final positions, orientations, distance per robot and the known map
+    robot_diameter = cnst.ROBOT_DIAM if robot_diameter is None else robot_diameter
+    n_steps = 2 * int(np.ceil(cnst.CONE_LENGTH)) if n_steps is None else n_steps
+    shape, n_robots = tuple(np.shape(floor_plan)), len(positions)
+
+    blocks, buffers, names = [], {}, {}
+    for key, (size, dtype) in BUFFER_SPECS.items():
+        nbytes = max(1, int(np.prod(size(shape, n_robots))) * np.dtype(dtype).itemsize)
+        block = shared_memory.SharedMemory(create=True, size=nbytes)
+        blocks.append(block)
+        names[key] = block.name
+        buffers[key] = np.ndarray(size(shape, n_robots), dtype=dtype, buffer=block.buf)
+    buffers['floor_plan'][:] = floor_plan
+    buffers['known_map'][:] = -1
+    buffers['positions'][0] = positions
+    buffers['orientations'][0] = orientations
+    buffers['distance'][:] = 0.0
+    buffers['moving'][:] = False
+
+    try:
+        if n_workers == 1:
+            for step in range(n_steps_run):
+                step_slab(buffers, step, 0, 1, seed, None, n_rays, n_steps, robot_diameter)
+        else:
+            barrier = Barrier(n_workers, timeout=BARRIER_TIMEOUT)
+            workers = [Process(target=worker_loop, args=(names, shape, n_robots, w, n_workers, seed, barrier,
+                                                         n_steps_run, n_rays, n_steps, robot_diameter))
+                       for w in range(n_workers)]
+            for worker in workers:
+                worker.start()
+            join_workers(workers, barrier)
+            if any(worker.exitcode != 0 for worker in workers):
+                raise RuntimeError("domain worker failed")
+
+        final = n_steps_run % 2
+        return {
+            'positions': buffers['positions'][final].copy(),
+            'orientations': buffers['orientations'][final].copy(),
+            'distance': buffers['distance'].copy(),
+            'known_map': buffers['known_map'].copy(),
+        }
+    finally:
+        buffers.clear()
+        for block in blocks:
+            block.close()
+            block.unlink()
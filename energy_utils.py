@@ -0,0 +1,149 @@
+import csv
+
+import numpy as np
+import cnst
+
+# energy / cost of transport baseline for the team (meeting notes + RQ2)
+# per-robot totals live in preallocated arrays that grow by doubling, and every step adds a
+# small summary row so a batch run can stream them out without keeping robot history
+
+CELL_SIZE = 0.05            # m per grid cell
+STEP_TIME = 1.0             # s per simulation step
+GRAVITY = 9.81
+
+ROLLER_MASS = 0.1           # kg
+ROLLER_LOCOMOTION = 0.5     # J per cell of effort (terrain weighted distance)
+ROLLER_IDLE_POWER = 0.02    # W, electronics while deployed
+SENSOR_POWER = {'Cone Vision': 0.4, 'Heat Sensor': 0.05}  # W
+
+VINE_MASS = 0.5             # kg
+VINE_GROWTH = 2.0           # J per cell of vine effort
+
+SUMMARY_FIELDS = ['step', 'robots', 'locomotion', 'sensing', 'idle', 'vine', 'total']
+
+
+def create_energy_tracker(capacity=16, sink=None):
+    # sink: optional callable that gets each per-step summary dict
+    n_sensors = len(cnst.SENSOR_OPT)
+    return {
+        'n': 0,
+        'step': 0,
+        'sensor_power': np.array([SENSOR_POWER.get(option, 0.0) for option in cnst.SENSOR_OPT]),
+        'sensor_mask': np.zeros((capacity, n_sensors)),
+        'sense_power': np.zeros(capacity),
+        'locomotion': np.zeros(capacity),
+        'sensing': np.zeros(capacity),
+        'idle': np.zeros(capacity),
+        'effort': np.zeros(capacity),
+        'distance': np.zeros(capacity),
+        'vine': 0.0,
+        'vine_effort': 0.0,
+        'vine_distance': 0.0,
+        'vine_points': 0,
+        'per_step': np.zeros((64, len(SUMMARY_FIELDS))),
+        'sink': sink,
+    }
+
+def grow(tracker, capacity):
+    for key in ('sensor_mask', 'sense_power', 'locomotion', 'sensing', 'idle', 'effort', 'distance'):
+        old = tracker[key]
+        new = np.zeros((capacity,) + old.shape[1:])
+        new[:len(old)] = old
+        tracker[key] = new
+
+def register_robots(tracker, robots):
+    n, n_new = tracker['n'], len(robots)
+    if n_new <= n: return
+    if n_new > len(tracker['locomotion']):
+        grow(tracker, max(n_new, 2 * len(tracker['locomotion'])))
+    for i in range(n, n_new):
+        sensors = robots[i]['sensors']
+        tracker['sensor_mask'][i] = [sensors.get(option, False) for option in cnst.SENSOR_OPT]
+    tracker['sense_power'][n:n_new] = tracker['sensor_mask'][n:n_new] @ tracker['sensor_power']
+    tracker['n'] = n_new
+
+def update_energy(tracker, robots, vine_robot):
+    # robots are only ever appended, robot i keeps its slot
+    register_robots(tracker, robots)
+    n = tracker['n']
+
+    effort = np.fromiter((robot['effort'] for robot in robots), dtype=float, count=n)
+    locomotion = (effort - tracker['effort'][:n]) * ROLLER_LOCOMOTION
+    sensing = tracker['sense_power'][:n] * STEP_TIME
+    idle = ROLLER_IDLE_POWER * STEP_TIME
+
+    tracker['effort'][:n] = effort
+    tracker['distance'][:n] = np.fromiter((robot['distance_traveled'] for robot in robots), dtype=float, count=n)
+    tracker['locomotion'][:n] += locomotion
+    tracker['sensing'][:n] += sensing
+    tracker['idle'][:n] += idle
+
+    # vine: energy from the growth effort, distance from the new tip points
+    vine_effort = vine_robot.get('effort', 0.0)
+    vine = (vine_effort - tracker['vine_effort']) * VINE_GROWTH
+    tracker['vine_effort'] = vine_effort
+    tracker['vine'] += vine
+    positions = vine_robot['positions']
+    if len(positions) > max(tracker['vine_points'], 1):
+        new_points = np.asarray(positions[max(tracker['vine_points'] - 1, 0):])
+        tracker['vine_distance'] += np.sum(np.hypot(*np.diff(new_points, axis=0).T))
+    tracker['vine_points'] = len(positions)
+
+    row = (tracker['step'], n, locomotion.sum(), sensing.sum(), idle * n, vine,
+           locomotion.sum() + sensing.sum() + idle * n + vine)
+    step = tracker['step']
+    if step >= len(tracker['per_step']):
+        per_step = np.zeros((2 * len(tracker['per_step']), len(SUMMARY_FIELDS)))
+        per_step[:step] = tracker['per_step']
+        tracker['per_step'] = per_step
+    tracker['per_step'][step] = row
+    tracker['step'] += 1
+
+    if tracker['sink'] is not None:
+        tracker['sink'](dict(zip(SUMMARY_FIELDS, row)))
+
+def csv_sink(path):
+    # streams per-step summaries to a csv file as they are produced
+    f = open(path, 'w', newline='')
+    writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+    writer.writeheader()
+
+    def sink(summary):
+        writer.writerow(summary)
+        f.flush()
+    sink.close = f.close
+    return sink
+
+def per_step_summaries(tracker):
+    return tracker['per_step'][:tracker['step']]
+
+def cost_of_transport(energy, mass, distance_cells):
+    # dimensionless COT = E / (m g d), nan before anything has moved
+    distance = np.asarray(distance_cells, dtype=float) * CELL_SIZE
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(distance > 0, energy / (mass * GRAVITY * distance), np.nan)
+
+def energy_results(tracker, per_step=False):
+    # per_step adds every per-step summary, for runs that have no sink
+    n = tracker['n']
+    robot_energy = tracker['locomotion'][:n] + tracker['sensing'][:n] + tracker['idle'][:n]
+    robot_cot = cost_of_transport(robot_energy, ROLLER_MASS, tracker['distance'][:n])
+
+    team_energy = robot_energy.sum() + tracker['vine']
+    team_work = (ROLLER_MASS * tracker['distance'][:n].sum() + VINE_MASS * tracker['vine_distance']) * CELL_SIZE * GRAVITY
+
+    results = {
+        'energy_total': float(team_energy),
+        'energy_per_robot': robot_energy.tolist(),
+        'energy_locomotion': float(tracker['locomotion'][:n].sum()),
+        'energy_sensing': float(tracker['sensing'][:n].sum()),
+        'energy_vine': float(tracker['vine']),
+        'cot_per_robot': [None if np.isnan(c) else float(c) for c in robot_cot],
+        'cot_vine': float(cost_of_transport(tracker['vine'], VINE_MASS, tracker['vine_distance'])) if tracker['vine_distance'] else None,
+        'cot_team': float(team_energy / team_work) if team_work else None,
+    }
+    if per_step:
+        results['energy_per_step'] = [{field: int(value) if field in ('step', 'robots') else float(value)
+                                       for field, value in zip(SUMMARY_FIELDS, row)}
+                                      for row in per_step_summaries(tracker)]
+    return results
@@ -0,0 +1,73 @@
+import numpy as np
+
+# stop conditions / event triggers checked once per step
+# a condition is a function sim -> bool, it only reads the sim dict so it is
+# cheap enough to evaluate every step
+
+
+def coverage_at_least(fraction, free_only=True):
+    free_cells = {}  # floor plan never changes during a run, count its free cells once
+
+    def condition(sim):
+        known_map = sim['known_map']
+        if free_only:
+            key = id(sim['floor_plan'])
+            if key not in free_cells:
+                free_cells.clear()
+                free_cells[key] = np.count_nonzero(sim['floor_plan'] == 1)
+            return free_cells[key] > 0 and np.count_nonzero(known_map == 1) >= fraction * free_cells[key]
+        return np.count_nonzero(known_map != -1) >= fraction * known_map.size
+    return condition
+
+def heat_at_least(threshold):
+    def condition(sim):
+        return sim['heat_map_enabled'] and np.max(sim['known_heat_map']) >= threshold
+    return condition
+
+def all_robots_stuck(min_steps=1):
+    def condition(sim):
+        return bool(sim['robots']) and all(robot['stuck_steps'] >= min_steps for robot in sim['robots'])
+    return condition
+
+def vine_done(min_stuck_steps=1):
+    # vine has grown and stopped, nothing left to drop and no robot still moving
+    def condition(sim):
+        vine_robot = sim['vine_robot']
+        if vine_robot['active'] or not vine_robot['positions'] or sim.get('pending_drops'):
+            return False
+        return all(robot['stuck_steps'] >= min_stuck_steps for robot in sim['robots'])
+    return condition
+
+CONDITIONS = {
+    'coverage': coverage_at_least,
+    'heat': heat_at_least,
+    'all_stuck': all_robots_stuck,
+    'vine_done': vine_done,
+}
+
+def make_event(name, condition, stop=True, callback=None):
+    return {'name': name, 'condition': condition, 'stop': stop,
+            'callbacks': [] if callback is None else [callback], 'fired_step': None}
+
+def events_from_spec(spec):
+    # {'coverage': 0.9, 'all_stuck': 5, 'vine_done': True} -> stop events, json friendly for sweeps
+    events = []
+    for name, value in spec.items():
+        if value is True:
+            events.append(make_event(name, CONDITIONS[name]()))
+        elif value is not None and value is not False:
+            events.append(make_event(name, CONDITIONS[name](value)))
+    return events
+
+def check_events(events, sim):
+    # fires each event once, records the step and returns True if a stop event fired
+    stop = False
+    for event in events:
+        if event['fired_step'] is not None or not event['condition'](sim):
+            continue
+        event['fired_step'] = sim['step']
+        sim.setdefault('events_fired', []).append({'name': event['name'], 'step': sim['step']})
+        for callback in event['callbacks']:
+            callback(event, sim)
+        stop = stop or event['stop']
+    return stop
@@ -0,0 +1,152 @@
+import numpy as np
+
+from comm_utils import sensed_cells
+
+# heat source localisation from the heat readings, a particle filter over the
+# get_heat_at_position field model (exp(-d^2 / 2 sigma^2), sigma = max(shape) / 5)
+# B filters are updated together, e.g. one per sim in a batch or per env in rl_env_utils;
+# particles are (B, P, K, 2): K source positions per particle, a cell reads the hottest source
+# every cell is used once per filter, re-reading it would only make the filter overconfident
+
+
+def create_heat_filter(shape, n_filters=1, n_particles=1000, n_sources=1, free_masks=None,
+                       noise=0.05, jitter=0.5, seed=0):
+    # free_masks: (B, H, W) cells a source can be in, the whole map by default
+    rng = np.random.default_rng(seed)
+    if free_masks is None:
+        free_masks = np.ones((n_filters,) + tuple(shape), dtype=bool)
+    particles = np.zeros((n_filters, n_particles, n_sources, 2))
+    for b, mask in enumerate(np.asarray(free_masks, dtype=bool)):
+        cells = np.argwhere(mask)
+        particles[b] = cells[rng.integers(0, len(cells), size=(n_particles, n_sources))]
+    return {
+        'shape': tuple(shape),
+        'sigma': max(shape) / 5,
+        'noise': noise,
+        'jitter': jitter,
+        'rng': rng,
+        'particles': sort_sources(particles),
+        'log_w': np.full((n_filters, n_particles), -np.log(n_particles)),
+        'consumed': np.zeros((n_filters,) + tuple(shape), dtype=bool),
+        'n_readings': np.zeros(n_filters, dtype=int),
+    }
+
+def sort_sources(particles):
+    # sources in a particle have no order, sort them by x so means over particles make sense
+    if particles.shape[2] == 1:
+        return particles
+    order = np.argsort(particles[..., 0], axis=2)
+    return np.take_along_axis(particles, order[..., None], axis=2)
+
+def predicted_heat(particles, cells, sigma):
+    # particles (U, P, K, 2), cells (U, M, 2) -> (U, M, P); |c - p|^2 expanded so the cross
+    # term is one batched matmul instead of a (U, M, P, K, 2) difference array
+    n_filters, n_particles, n_sources, _ = particles.shape
+    points = particles.transpose(0, 2, 1, 3).reshape(n_filters, n_sources * n_particles, 2)
+    d_sq = cells @ points.transpose(0, 2, 1)
+    d_sq *= -2
+    d_sq += np.sum(cells ** 2, axis=-1)[:, :, None]
+    d_sq += np.sum(points ** 2, axis=-1)[:, None, :]
+    nearest = d_sq[:, :, :n_particles]
+    for k in range(1, n_sources):
+        np.minimum(nearest, d_sq[:, :, k * n_particles:(k + 1) * n_particles], out=nearest)
+    np.maximum(nearest, 0, out=nearest)
+    return np.exp(nearest * (-1 / (2 * sigma ** 2)))
+
+def observe(filt, filters, cells, values):
+    # readings: filters (M,) which filter each belongs to, cells (M, 2), values (M,)
+    filters = np.asarray(filters, dtype=int)
+    cells = np.asarray(cells, dtype=int).reshape(-1, 2)
+    values = np.asarray(values, dtype=float)
+
+    # drop cells this filter has already used (and repeats within this batch)
+    flat = np.ravel_multi_index((filters, cells[:, 0], cells[:, 1]), filt['consumed'].shape)
+    flat, first = np.unique(flat, return_index=True)
+    new = ~filt['consumed'].reshape(-1)[flat]
+    first = first[new]
+    if len(first) == 0:
+        return
+    filt['consumed'].reshape(-1)[flat[new]] = True
+    filters, cells, values = filters[first], cells[first], values[first]
+
+    # readings grouped per filter into a (U, M) block, padding masked out
+    order = np.argsort(filters, kind='stable')
+    filters, cells, values = filters[order], cells[order], values[order]
+    updated, starts, counts = np.unique(filters, return_index=True, return_counts=True)
+    slot = np.arange(len(filters)) - np.repeat(starts, counts)
+    row = np.repeat(np.arange(len(updated)), counts)
+    block_cells = np.zeros((len(updated), counts.max(), 2))
+    block_values = np.zeros((len(updated), counts.max()))
+    valid = np.zeros((len(updated), counts.max()), dtype=bool)
+    block_cells[row, slot], block_values[row, slot], valid[row, slot] = cells, values, True
+
+    # gaussian reading noise, summed per filter
+    predicted = predicted_heat(filt['particles'][updated], block_cells, filt['sigma'])
+    predicted -= block_values[:, :, None]
+    predicted **= 2
+    # masked sum over the readings as a batched matmul, (U, 1, M) @ (U, M, P)
+    filt['log_w'][updated] -= (valid[:, None, :] @ predicted)[:, 0] / (2 * filt['noise'] ** 2)
+    filt['n_readings'][updated] += counts
+
+    log_w = filt['log_w'][updated]
+    filt['log_w'][updated] = log_w - logsumexp(log_w)[:, None]
+    resample(filt, updated)
+
+def logsumexp(log_w):
+    top = np.max(log_w, axis=1)
+    return top + np.log(np.sum(np.exp(log_w - top[:, None]), axis=1))
+
+def effective_sample_size(filt):
+    return 1.0 / np.sum(np.exp(2 * filt['log_w']), axis=1)
+
+def resample(filt, filters):
+    # systematic resampling of the filters whose weights collapsed, all in one searchsorted,
+    # then a small jitter so the copies can spread out again
+    n_particles = filt['log_w'].shape[1]
+    filters = filters[effective_sample_size(filt)[filters] < n_particles / 2]
+    if len(filters) == 0:
+        return
+    n = len(filters)
+    rows = np.arange(n)[:, None]
+    cumulative = np.cumsum(np.exp(filt['log_w'][filters]), axis=1)
+    cumulative /= cumulative[:, -1:]
+    u = (filt['rng'].random((n, 1)) + np.arange(n_particles)) / n_particles
+    picks = np.searchsorted((cumulative + rows).ravel(), (u + rows).ravel()).reshape(n, n_particles)
+    picks = np.minimum(picks - rows * n_particles, n_particles - 1)
+
+    particles = np.take_along_axis(filt['particles'][filters], picks[:, :, None, None], axis=1)
+    particles = particles + filt['rng'].normal(0, filt['jitter'], size=particles.shape)
+    particles = np.clip(particles, 0, np.array(filt['shape']) - 1)
+    filt['particles'][filters] = sort_sources(particles)
+    filt['log_w'][filters] = -np.log(n_particles)
+
+def estimate(filt):
+    # weighted mean (B, K, 2) and spread (B, K): sqrt of the summed coordinate variances
+    w = np.exp(filt['log_w'])[:, :, None, None]
+    mean = np.sum(w * filt['particles'], axis=1)
+    var = np.sum(w * (filt['particles'] - mean[:, None]) ** 2, axis=1)
+    return mean, np.sqrt(np.sum(var, axis=-1))
+
+def observe_robots(filt, robots, floor_plan, cone_points_list, known_heat_map, filter_index=0):
+    # feed one sim's heat sensing this step into filter filter_index
+    cells = [sensed_cells(robot, floor_plan, cone_points)[0]
+             for robot, cone_points in zip(robots, cone_points_list)
+             if robot['sensors'].get('Heat Sensor', False)]
+    if not cells:
+        return
+    cells = np.concatenate(cells)
+    values = known_heat_map[cells[:, 0], cells[:, 1]]
+    read = values >= 0
+    observe(filt, np.full(np.count_nonzero(read), filter_index), cells[read], values[read])
+
+def heat_filter_results(filt, heat_source_position=None, filter_index=0):
+    mean, spread = estimate(filt)
+    results = {
+        'heat_estimate': mean[filter_index].tolist(),
+        'heat_estimate_spread': spread[filter_index].tolist(),
+        'heat_readings_used': int(filt['n_readings'][filter_index]),
+    }
+    if heat_source_position is not None:
+        # error of the closest estimated source
+        results['heat_estimate_error'] = float(np.min(np.hypot(*(mean[filter_index] - np.asarray(heat_source_position)).T)))
+    return results
@@ -9,8 +9,10 @@ from matplotlib.gridspec import GridSpec
 import functools
 
 from map_utils import generate_floor_plan, plot_floor_plan, plot_robot_view, plot_known_heat_map
-from robot_utils import move_robot, sense_environment, check_collision
-from vine_robot_utils import move_vine_robot
+from robot_utils import move_robot, sense_environment, check_collision, create_robot
+from vine_robot_utils import move_vine_robot, deploy_from_vine
+from reachability_utils import get_reachability, is_placeable, reachable_area
+from event_utils import make_event, check_events, vine_done, all_robots_stuck, heat_at_least
 
 import cnst
 
@@ -20,6 +22,7 @@ from gui_utils import speed_up, slow_down, start_simulation, add_vine_robot, kil
 def main():
     
     floor_plan = generate_floor_plan(cnst.GRID_SIZE, cnst.MAP)
+    reach = get_reachability(floor_plan, cnst.ROBOT_DIAM)
     known_map = -1 * np.ones(cnst.GRID_SIZE)
     known_heat_map = -1 * np.ones(cnst.GRID_SIZE)
 
@@ -48,32 +51,14 @@ def main():
             print("Vine robot has not been placed or has not moved yet.")
 
     def create_robot_after_sensor_selection():
-        tip_x, tip_y = vine_robot['positions'][-1]
-        offset_distance = 2
-        orientation = vine_robot['orientation']
-        new_x = tip_x + offset_distance * np.cos(orientation)
-        new_y = tip_y + offset_distance * np.sin(orientation)
-        new_position = (new_x, new_y)
-        int_x, int_y = int(round(new_position[0])), int(round(new_position[1]))
-        
-        if ( 0 <= int_x < floor_plan.shape[0]
-            and 0 <= int_y < floor_plan.shape[1]
-            and floor_plan[int_x, int_y] == 1
-            and not check_collision(new_position, None, robots, floor_plan, cnst.ROBOT_DIAM)):
-            
-            orientation = np.random.uniform(0, 2 * np.pi)
-            robot = {
-                'position': new_position,
-                'orientation': orientation,
-                'sensors': sensor_selections.copy(),
-                'distance_traveled': 0.0
-            }
-            robots.append(robot)
-            print(f"RESCUE Roller deployed at ({int_x}, {int_y}) with orientation {orientation:.2f} radians")
-            adding_rr[0] = False
+        robot = deploy_from_vine(vine_robot, robots, floor_plan, sensor_selections)
+        if robot is not None:
+            int_x, int_y = int(round(robot['position'][0])), int(round(robot['position'][1]))
+            print(f"RESCUE Roller deployed at ({int_x}, {int_y}) with orientation {robot['orientation']:.2f} radians")
+            print(f"It can reach {reachable_area(reach, robot['position'])} cells from there.")
         else:
             print("Cannot deploy RESCUE Roller at this position. It may be blocked or occupied.")
-            adding_rr[0] = False
+        adding_rr[0] = False
 
     def start_sensor_selection():
         selecting_sensors[0] = True
@@ -127,16 +112,13 @@ def main():
 
             # check not in wall
             if 0 <= int_x < floor_plan.shape[0] and 0 <= int_y < floor_plan.shape[1]:
-                if floor_plan[int_x, int_y] == 1 and not check_collision((iy, ix), None, robots, floor_plan, cnst.ROBOT_DIAM):
+                if (floor_plan[int_x, int_y] == 1
+                    and (not adding_robot[0] or is_placeable(reach, (iy, ix)))
+                    and not check_collision((iy, ix), None, robots, floor_plan, cnst.ROBOT_DIAM)):
                     
                     if adding_robot[0]:
                         orientation = np.random.uniform(0, 2 * np.pi)
-                        robot = {
-                            'position': (iy, ix),
-                            'orientation': orientation,
-                            'sensors': sensor_selections.copy(),
-                            'distance_traveled': 0.0
-                        }
+                        robot = create_robot((iy, ix), orientation, sensor_selections)
                         robots.append(robot)
                         
                         plot_floor_plan(floor_plan, robots, vine_robot, axes[0], cnst.ROBOT_DIAM, heat_map_enabled[0], heat_source_position[0])
@@ -146,6 +128,7 @@ def main():
                             plot_known_heat_map(known_heat_map, axes[2])
                         plt.draw()
                         print(f"Robot added at ({int_x}, {int_y}) with orientation {orientation:.2f} radians")
+                        print(f"It can reach {reachable_area(reach, (iy, ix))} cells from there.")
                         adding_robot[0] = False
                     elif adding_vine_robot_stage[0] == 1:       # 1. set starting position
                         vine_robot['positions'] = [(iy, ix)]
@@ -223,6 +206,8 @@ def main():
         adding_robot[0] = False
         adding_vine_robot_stage[0] = 0
         step = 0
+        for event in stop_events:
+            event['fired_step'] = None
 
         for ax in axes:
             ax.clear()
@@ -312,6 +297,21 @@ def main():
     # Main Loop
     # ================================================================================================================================
     
+    def report_event(event, state):
+        print(f"Event '{event['name']}' at step {state['step']}.")
+
+    vine_stopped = vine_done()
+
+    def vine_done_with_rollers(sim):
+        # the vine stopping before any roller is dropped does not end a GUI session
+        return bool(sim['robots']) and vine_stopped(sim)
+
+    stop_events = [
+        make_event('vine done', vine_done_with_rollers, callback=report_event),
+        make_event('all robots stuck', all_robots_stuck(min_steps=10), callback=report_event),
+        make_event('heat source found', heat_at_least(0.95), stop=False, callback=report_event),
+    ]
+
     step = 0
     while step < cnst.MAX_STEPS:
         if simulation_running[0]:
@@ -327,6 +327,14 @@ def main():
 
             step += 1
             print("step")
+
+            state = {'floor_plan': floor_plan, 'known_map': known_map, 'known_heat_map': known_heat_map,
+                     'robots': robots, 'vine_robot': vine_robot, 'heat_map_enabled': heat_map_enabled[0], 'step': step}
+            if check_events(stop_events, state):
+                simulation_running[0] = False
+                start_button.ax.set_visible(True)
+                plt.draw()
+                print("Simulation stopped early.")
         else:
             plt.pause(0.1)
 
@@ -0,0 +1,131 @@
+import os
+import csv
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import ndimage
+import cnst
+
+from map_utils import floor_plan_key
+
+# per-map statistics for the README to-do list (obstacle density, gap frequency and
+# width, minimum aperture)
+# a gap is where free space is pinched: a run of free cells closed by walls on both sides
+# (the map edge does not count) that is shorter than the runs on both sides of it along the
+# passage, e.g. a doorway or the space between two rubble piles; its width is the run length
+# runs wider than GAP_DIAMETERS robot diameters are rooms, a room between two doorways is
+# pinched in this sense too
+# the gap statistics (n_gaps, gap widths, min_aperture, passable_gap_fraction) are only valid
+# for axis-aligned maps such as map_gen_utils makes: a diagonal wall is a staircase of short
+# runs, so a door cut through it is not found at all, and the ends of a diagonal wall show up
+# as gaps as narrow as the axis runs past them
+
+FEATURES = ['map', 'cells', 'obstacle_density', 'n_obstacles', 'n_regions', 'n_gaps', 'gaps_per_1000_cells',
+            'min_aperture', 'mean_gap_width', 'max_gap_width', 'median_clearance', 'passable_gap_fraction']
+
+GAP_DIAMETERS = 6
+
+
+def free_distance(floor_plan):
+    # distance from each free cell to the nearest wall, the map edge counts as a wall
+    free = np.pad(np.asarray(floor_plan) == 1, 1, constant_values=False)
+    return ndimage.distance_transform_edt(free)[1:-1, 1:-1]
+
+def medial_axis(dist):
+    # ridge of the distance field: local max across x or across y
+    padded = np.pad(dist, 1)
+    ridge_x = (dist >= padded[:-2, 1:-1]) & (dist >= padded[2:, 1:-1])
+    ridge_y = (dist >= padded[1:-1, :-2]) & (dist >= padded[1:-1, 2:])
+    return (dist > 0) & (ridge_x | ridge_y)
+
+def free_runs(free):
+    # first and last index of the free run along y through each cell (valid on free cells)
+    n = free.shape[1]
+    idx = np.arange(n)
+    before = np.pad(free, ((0, 0), (1, 0)))[:, :-1]
+    after = np.pad(free, ((0, 0), (0, 1)))[:, 1:]
+    lo = np.maximum.accumulate(np.where(free & ~before, idx, 0), axis=1)
+    hi = np.minimum.accumulate(np.where(free & ~after, idx, n)[:, ::-1], axis=1)[:, ::-1]
+    return lo, hi
+
+def pinched_runs(free, max_width):
+    # run length across y, and the cells whose run is a gap along x: closed by walls, at most
+    # max_width long, and the same run continues for a few rows (a plateau, e.g. through a
+    # thick wall) with longer runs on both sides of it
+    n_x, n_y = free.shape
+    lo, hi = free_runs(free)
+    length = np.where(free, hi - lo + 1, 0)
+    closed = free & (lo > 0) & (hi < n_y - 1) & (length <= max_width)
+
+    same = free[1:] & free[:-1] & (lo[1:] == lo[:-1]) & (hi[1:] == hi[:-1])
+    rows = np.arange(n_x)[:, None]
+    first = np.maximum.accumulate(np.where(np.vstack([np.ones((1, n_y), bool), ~same]), rows, 0), axis=0)
+    last = np.minimum.accumulate(np.where(np.vstack([~same, np.ones((1, n_y), bool)]), rows, n_x)[::-1], axis=0)[::-1]
+    padded = np.pad(length, ((1, 1), (0, 0)))
+    cols = np.arange(n_y)[None, :]
+    pinched = closed & (padded[first, cols] > length) & (padded[last + 2, cols] > length)
+    return length, pinched
+
+def analyze_map(floor_plan, robot_diameter=None, max_gap_width=None):
+    robot_diameter = cnst.ROBOT_DIAM if robot_diameter is None else robot_diameter
+    max_gap_width = GAP_DIAMETERS * robot_diameter if max_gap_width is None else max_gap_width
+    floor_plan = np.asarray(floor_plan)
+    walls = floor_plan == 0
+    eight = np.ones((3, 3), dtype=int)
+
+    # passages along x (runs across y) and along y (runs across x)
+    length_y, pinched_y = pinched_runs(~walls, max_gap_width)
+    length_x, pinched_x = pinched_runs(~walls.T, max_gap_width)
+    length_x, pinched_x = length_x.T, pinched_x.T
+
+    # typical free width along the medial axis, the shorter of the two runs through it
+    ridge_widths = np.minimum(length_y, length_x)[medial_axis(free_distance(floor_plan))]
+
+    # one gap per connected cluster of gap cells, its width is the narrowest run through it
+    # and the narrowest gap is the minimum aperture of the map
+    cell_widths = np.minimum(np.where(pinched_y, length_y, np.inf), np.where(pinched_x, length_x, np.inf))
+    gap_labels, n_gaps = ndimage.label(np.isfinite(cell_widths), structure=eight)
+    if n_gaps:
+        gap_widths = ndimage.minimum(cell_widths, gap_labels, index=np.arange(1, n_gaps + 1))
+    else:
+        gap_widths = np.zeros(0)
+
+    _, n_obstacles = ndimage.label(walls, structure=eight)
+    _, n_regions = ndimage.label(~walls)
+    free_cells = np.count_nonzero(~walls)
+
+    return {
+        'map': floor_plan_key(floor_plan),
+        'cells': int(floor_plan.size),
+        'obstacle_density': float(np.count_nonzero(walls) / floor_plan.size),
+        'n_obstacles': int(n_obstacles),
+        'n_regions': int(n_regions),
+        'n_gaps': int(n_gaps),
+        'gaps_per_1000_cells': float(1000 * n_gaps / free_cells) if free_cells else 0.0,
+        'min_aperture': float(gap_widths.min()) if n_gaps else np.nan,
+        'mean_gap_width': float(gap_widths.mean()) if n_gaps else np.nan,
+        'max_gap_width': float(gap_widths.max()) if n_gaps else np.nan,
+        'median_clearance': float(np.median(ridge_widths)) if ridge_widths.size else np.nan,
+        'passable_gap_fraction': float(np.mean(gap_widths >= robot_diameter)) if n_gaps else np.nan,
+    }
+
+def analyze_maps(floor_plans, robot_diameter=None, processes=None):
+    # processes=None uses every core, 1 stays in this process
+    if processes == 1:
+        return [analyze_map(floor_plan, robot_diameter) for floor_plan in floor_plans]
+    floor_plans = list(floor_plans)
+    chunksize = max(1, len(floor_plans) // (4 * (processes or os.cpu_count())))
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(analyze_map, floor_plans, [robot_diameter] * len(floor_plans), chunksize=chunksize))
+
+def feature_table(rows):
+    # list of feature dicts -> structured array, one record per map
+    dtype = [('map', 'U40')] + [(name, 'f8') for name in FEATURES[1:]]
+    return np.array([tuple(row[name] for name in FEATURES) for row in rows], dtype=dtype)
+
+def write_feature_table(rows, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FEATURES)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({name: row[name] for name in FEATURES})
@@ -0,0 +1,193 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import cnst
+
+# procedural collapse-site maps: rooms from a binary space partition, walls with gaps,
+# then rubble scattered up to an obstacle density
+# walls come out as the same (y, x, width, height) tuples generate_floor_plan takes,
+# so a generated map can be dropped into cnst.MAP or a sweep scenario's 'walls'
+
+DEFAULT_CACHE = 'map_cache'
+GENERATOR_VERSION = 2  # part of the cache key, bump when the same seed gives a different map
+
+MAP_PARAMS = {
+    'grid_size': cnst.GRID_SIZE,
+    'wall_thickness': 2,
+    'min_room': 20,             # rooms are not split below this many cells per side
+    'gap_frequency': 1.0,       # expected gaps per internal wall, every wall gets at least one
+    'gap_width': (4, 10),
+    'min_aperture': 3,          # narrowest doorway / clearance around rubble
+    'obstacle_density': 0.05,   # fraction of the free cells covered by rubble
+    'rubble_size': (1, 5),
+}
+
+
+def map_params(params=None):
+    full = dict(MAP_PARAMS)
+    full.update(params or {})
+    return full
+
+def rasterize_walls(grid_size, walls):
+    # vectorized generate_floor_plan: every rectangle adds +1 on a 2D difference array
+    n_x, n_y = grid_size
+    diff = np.zeros((n_x + 1, n_y + 1), dtype=np.int32)
+    if len(walls):
+        walls = np.asarray(walls, dtype=int).reshape(-1, 4)
+        y0 = np.clip(walls[:, 0], 0, n_y)
+        x0 = np.clip(walls[:, 1], 0, n_x)
+        y1 = np.clip(walls[:, 0] + walls[:, 2], 0, n_y)
+        x1 = np.clip(walls[:, 1] + walls[:, 3], 0, n_x)
+        np.add.at(diff, (x0, y0), 1)
+        np.add.at(diff, (x0, y1), -1)
+        np.add.at(diff, (x1, y0), -1)
+        np.add.at(diff, (x1, y1), 1)
+    covered = diff.cumsum(axis=0).cumsum(axis=1)[:n_x, :n_y] > 0
+    return np.where(covered, 0.0, 1.0)
+
+def wall_with_gaps(start, end, gaps):
+    # split the run [start, end) around (gap_start, gap_end) intervals
+    segments = []
+    for gap_start, gap_end in sorted(gaps):
+        if gap_start > start:
+            segments.append((start, gap_start))
+        start = max(start, gap_end)
+    if start < end:
+        segments.append((start, end))
+    return segments
+
+def room_walls(params, rng):
+    n_x, n_y = params['grid_size']
+    t = params['wall_thickness']
+    min_room = params['min_room']
+    gap_lo, gap_hi = params['gap_width']
+    gap_lo = max(gap_lo, params['min_aperture'])
+    gap_hi = max(gap_hi, gap_lo)
+
+    # boundary
+    walls = [(0, 0, n_y, t), (0, n_x - t, n_y, t), (0, 0, t, n_x), (n_y - t, 0, t, n_x)]
+
+    # rooms: (x0, y0, x1, y1) interiors and the gaps in the walls on their four sides,
+    # (x0 side, x1 side) as y intervals and (y0 side, y1 side) as x intervals
+    rooms = [((t, t, n_x - t, n_y - t), ([], [], [], []))]
+    while rooms:
+        (x0, y0, x1, y1), sides = rooms.pop()
+        split_x = x1 - x0 >= 2 * min_room + t
+        split_y = y1 - y0 >= 2 * min_room + t
+        if not (split_x or split_y):
+            continue
+        axis = 0 if split_x and (not split_y or x1 - x0 >= y1 - y0) else 1
+        lo, hi = (x0, x1) if axis == 0 else (y0, y1)
+
+        # the new wall must not land in or next to a gap of the walls it runs into, that
+        # would narrow the gap below min_aperture
+        cuts = np.arange(lo + min_room, hi - min_room - t + 1)
+        for gap_start, gap_end in sides[2] + sides[3] if axis == 0 else sides[0] + sides[1]:
+            cuts = cuts[(cuts + t + params['min_aperture'] <= gap_start) | (cuts - params['min_aperture'] >= gap_end)]
+        if len(cuts) == 0:
+            continue
+        cut = int(cuts[rng.integers(len(cuts))])
+
+        # wall across the room with at least one gap so every room stays connected
+        run_start, run_end = (y0, y1) if axis == 0 else (x0, x1)
+        n_gaps = max(1, rng.poisson(params['gap_frequency']))
+        widths = rng.integers(gap_lo, gap_hi + 1, size=n_gaps)
+        widths = np.minimum(widths, run_end - run_start)
+        starts = rng.integers(run_start, run_end - widths + 1)
+        gaps = list(zip(starts, starts + widths))
+
+        for seg_start, seg_end in wall_with_gaps(run_start, run_end, gaps):
+            if axis == 0:
+                walls.append((int(seg_start), cut, int(seg_end - seg_start), t))
+            else:
+                walls.append((cut, int(seg_start), t, int(seg_end - seg_start)))
+
+        if axis == 0:
+            rooms += [((x0, y0, cut, y1), (sides[0], gaps, sides[2], sides[3])),
+                      ((cut + t, y0, x1, y1), (gaps, sides[1], sides[2], sides[3]))]
+        else:
+            rooms += [((x0, y0, x1, cut), (sides[0], sides[1], sides[2], gaps)),
+                      ((x0, cut + t, x1, y1), (sides[0], sides[1], gaps, sides[3]))]
+    return walls
+
+def rubble_walls(params, rng, walls):
+    # rubble rectangles that keep min_aperture clearance from every other obstacle,
+    # candidates are drawn and checked against the occupied area in batches
+    n_x, n_y = params['grid_size']
+    clearance = params['min_aperture']
+    size_lo, size_hi = params['rubble_size']
+    occupied = rasterize_walls((n_x, n_y), walls) == 0
+    target = params['obstacle_density'] * np.count_nonzero(~occupied)
+
+    rubble = []
+    covered = 0
+    for _ in range(50):
+        if covered >= target:
+            break
+        # summed-area table of the occupied cells, so each candidate's clearance box is O(1)
+        sat = np.zeros((n_x + 1, n_y + 1), dtype=np.int32)
+        sat[1:, 1:] = occupied.cumsum(axis=0).cumsum(axis=1)
+
+        n = 256
+        h = rng.integers(size_lo, size_hi + 1, size=n)
+        w = rng.integers(size_lo, size_hi + 1, size=n)
+        x = rng.integers(0, n_x - h + 1)
+        y = rng.integers(0, n_y - w + 1)
+
+        bx0, by0 = np.clip(x - clearance, 0, n_x), np.clip(y - clearance, 0, n_y)
+        bx1, by1 = np.clip(x + h + clearance, 0, n_x), np.clip(y + w + clearance, 0, n_y)
+        hits = sat[bx1, by1] - sat[bx0, by1] - sat[bx1, by0] + sat[bx0, by0]
+        ok = np.flatnonzero(hits == 0)
+
+        # survivors can still crowd each other, accept them greedily
+        for i in ok:
+            if covered >= target:
+                break
+            if occupied[bx0[i]:bx1[i], by0[i]:by1[i]].any():
+                continue
+            occupied[x[i]:x[i] + h[i], y[i]:y[i] + w[i]] = True
+            rubble.append((int(y[i]), int(x[i]), int(w[i]), int(h[i])))
+            covered += h[i] * w[i]
+    return rubble
+
+def generate_walls(params=None, seed=0):
+    params = map_params(params)
+    rng = np.random.default_rng(seed)
+    walls = room_walls(params, rng)
+    return walls + rubble_walls(params, rng, walls)
+
+def generate_map(params=None, seed=0):
+    params = map_params(params)
+    return rasterize_walls(params['grid_size'], generate_walls(params, seed))
+
+def map_cache_key(params, seed):
+    blob = json.dumps({'params': map_params(params), 'seed': seed, 'version': GENERATOR_VERSION}, sort_keys=True, default=str)
+    return hashlib.sha1(blob.encode()).hexdigest()
+
+def cached_map(params, seed, cache_dir=DEFAULT_CACHE):
+    path = os.path.join(cache_dir, map_cache_key(params, seed) + '.npy')
+    if os.path.exists(path):
+        return np.load(path).astype(float)
+
+    floor_plan = generate_map(params, seed)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = path + '.tmp.npy'
+    np.save(tmp_path, floor_plan.astype(np.int8))
+    os.replace(tmp_path, path)
+    return floor_plan
+
+def generate_maps(seeds, params=None, processes=None, cache_dir=DEFAULT_CACHE):
+    # one map per seed, generated in a process pool and cached on disk (cache_dir=None skips the cache)
+    seeds = list(seeds)
+    if cache_dir is None:
+        job, args = generate_map, ([params] * len(seeds), seeds)
+    else:
+        job, args = cached_map, ([params] * len(seeds), seeds, [cache_dir] * len(seeds))
+    if processes == 1:
+        return list(map(job, *args))
+    chunksize = max(1, len(seeds) // (4 * (processes or os.cpu_count())))
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(job, *args, chunksize=chunksize))
@@ -1,3 +1,5 @@
+import hashlib
+
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib import colors
@@ -18,6 +20,13 @@ def generate_floor_plan(grid_size, walls):
 
     return floor_plan
 
+def floor_plan_key(floor_plan):
+    # content hash of a floor plan, used to key caches and stored results
+    floor_plan = np.ascontiguousarray(floor_plan, dtype=np.int8)
+    digest = hashlib.sha1(str(floor_plan.shape).encode())
+    digest.update(floor_plan.tobytes())
+    return digest.hexdigest()
+
 def get_triangle_vertices(x, y, orientation, size=0.7):
     tip_x = y + size * np.sin(orientation)
     tip_y = x + size * np.cos(orientation)
@@ -0,0 +1,267 @@
+import os
+import hashlib
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import spsolve
+import cnst
+
+from map_utils import floor_plan_key
+from reachability_utils import get_reachability
+
+# Markov decision process of the team for RQ5, built straight from the simulator's motion model
+# rescue roller: state = free configuration cell, action = heading; move_robot's jitter is
+# integrated with a few quadrature points and a bump takes the first free of the shuffled
+# +90 / -90 / 180 turns, which is uniform over the free ones
+# vine: state = tip index along its straight growth line, actions grow / drop a roller
+# (an undeployed roller rides at the vine tip until it is dropped, RQ5's second option)
+# transitions are one sparse (A * S) x S matrix so value iteration is a single matmul per sweep
+
+JITTER = np.pi / 18
+BUMP_ANGLES = [np.pi / 2, -np.pi / 2, np.pi]
+SOLVE_TOL = 1e-9  # relative accuracy trusted from spsolve
+
+# in-process caches, least recently used dropped first
+MAX_MDPS = 8
+MAX_SOLUTIONS = 64
+_mdp_cache = {}
+_solution_cache = {}
+
+
+def cache_get(cache, key):
+    if key not in cache:
+        return None
+    cache[key] = cache.pop(key)  # most recently used goes last
+    return cache[key]
+
+def cache_put(cache, key, value, max_size):
+    if len(cache) >= max_size:
+        cache.pop(next(iter(cache)))
+    cache[key] = value
+
+def free_at(free, x, y):
+    int_x, int_y = np.rint(x).astype(int), np.rint(y).astype(int)
+    inside = (int_x >= 0) & (int_x < free.shape[0]) & (int_y >= 0) & (int_y < free.shape[1])
+    ok = np.zeros(int_x.shape, dtype=bool)
+    ok[inside] = free[int_x[inside], int_y[inside]]
+    return ok, int_x, int_y
+
+def roller_transitions(free, state_index, n_headings=8, n_jitter=5):
+    cells = np.argwhere(free)
+    n_states = len(cells)
+    headings = 2 * np.pi * np.arange(n_headings) / n_headings
+    jitter = JITTER * ((np.arange(n_jitter) + 0.5) / n_jitter * 2 - 1)  # midpoint quadrature
+
+    # (action, jitter, state)
+    theta = headings[:, None, None] + jitter[None, :, None]
+    theta = np.broadcast_to(theta, (n_headings, n_jitter, n_states))
+    x = cells[:, 0].astype(float)
+    y = cells[:, 1].astype(float)
+    src = np.broadcast_to(np.arange(n_states), theta.shape)
+    row = np.broadcast_to(np.arange(n_headings)[:, None, None] * n_states, theta.shape) + src
+    weight = 1.0 / n_jitter
+
+    rows, cols, vals = [], [], []
+
+    ok, tx, ty = free_at(free, x + np.cos(theta), y + np.sin(theta))
+    rows.append(row[ok]); cols.append(state_index[tx[ok], ty[ok]]); vals.append(np.full(ok.sum(), weight))
+
+    # bumped: spread over the free turn angles
+    bump_ok, bump_dst = [], []
+    for angle in BUMP_ANGLES:
+        b_ok, bx, by = free_at(free, x + np.cos(theta + angle), y + np.sin(theta + angle))
+        bump_ok.append(b_ok & ~ok)
+        bump_dst.append(np.where(b_ok, state_index[np.clip(bx, 0, free.shape[0] - 1), np.clip(by, 0, free.shape[1] - 1)], -1))
+    n_free = np.sum(bump_ok, axis=0)
+    for b_ok, dst in zip(bump_ok, bump_dst):
+        rows.append(row[b_ok]); cols.append(dst[b_ok]); vals.append(weight / n_free[b_ok])
+
+    # boxed in: stays
+    stuck = ~ok & (n_free == 0)
+    rows.append(row[stuck]); cols.append(src[stuck]); vals.append(np.full(stuck.sum(), weight))
+
+    P = sparse.coo_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                          shape=(n_headings * n_states, n_states)).tocsr()
+    return P, headings
+
+def vine_line(floor_plan, start, orientation, max_length=None):
+    # tip positions move_vine_robot would produce before it hits a wall
+    max_length = sum(floor_plan.shape) if max_length is None else max_length
+    positions = [tuple(start)]
+    for _ in range(max_length):
+        x, y = positions[-1]
+        new_x, new_y = x + np.cos(orientation), y + np.sin(orientation)
+        int_x, int_y = int(round(new_x)), int(round(new_y))
+        if not (0 <= int_x < floor_plan.shape[0] and 0 <= int_y < floor_plan.shape[1] and floor_plan[int_x, int_y] == 1):
+            break
+        positions.append((new_x, new_y))
+    return positions
+
+def mdp_key(floor_plan, robot_diameter, n_headings, n_jitter, vine):
+    key = hashlib.sha1(floor_plan_key(floor_plan).encode())
+    key.update(repr((float(robot_diameter), n_headings, n_jitter, vine)).encode())
+    return key.hexdigest()
+
+def build_team_mdp(floor_plan, robot_diameter=None, n_headings=8, n_jitter=5,
+                   vine_start=None, vine_orientation=None, drop_offset=2, cache_dir=None):
+    # states: [roller cells..., vine tip positions...], actions: [headings..., grow, drop]
+    robot_diameter = cnst.ROBOT_DIAM if robot_diameter is None else robot_diameter
+    vine = None if vine_start is None else (tuple(vine_start), float(vine_orientation), drop_offset)
+    key = mdp_key(floor_plan, robot_diameter, n_headings, n_jitter, vine)
+    mdp = cache_get(_mdp_cache, key)
+    if mdp is not None:
+        return mdp
+    path = None if cache_dir is None else os.path.join(cache_dir, key + '.npz')
+    if path is not None and os.path.exists(path):
+        mdp = load_mdp(path)
+        cache_put(_mdp_cache, key, mdp, MAX_MDPS)
+        return mdp
+
+    free = get_reachability(floor_plan, robot_diameter)['free']
+    state_index = np.full(free.shape, -1, dtype=np.int64)
+    cells = np.argwhere(free)
+    state_index[cells[:, 0], cells[:, 1]] = np.arange(len(cells))
+    n_rollers = len(cells)
+
+    P_roll, headings = roller_transitions(free, state_index, n_headings, n_jitter)
+
+    line = [] if vine is None else vine_line(floor_plan, vine_start, vine_orientation)
+    n_vine = len(line)
+    n_states = n_rollers + n_vine
+    n_actions = n_headings + 2
+
+    # roller actions keep their roller rows, vine tip states ignore them (self loop)
+    blocks = []
+    vine_ids = n_rollers + np.arange(n_vine)
+    for a in range(n_headings):
+        P_a = P_roll[a * n_rollers:(a + 1) * n_rollers]
+        P_a = sparse.hstack([P_a, sparse.csr_matrix((n_rollers, n_vine))])
+        blocks.append(sparse.vstack([P_a, sparse.csr_matrix((np.ones(n_vine), (np.arange(n_vine), vine_ids)),
+                                                            shape=(n_vine, n_states))]))
+
+    # grow: tip i -> i + 1 (the last one is against the wall and stays)
+    grow_dst = np.minimum(np.arange(n_vine) + 1, n_vine - 1) + n_rollers
+    # drop: tip i -> roller cell drop_offset ahead, if that cell is free
+    drop_dst = vine_ids.copy()
+    for i, (tip_x, tip_y) in enumerate(line):
+        ok, dx, dy = free_at(free, np.array(tip_x + drop_offset * np.cos(vine_orientation)),
+                             np.array(tip_y + drop_offset * np.sin(vine_orientation)))
+        if ok:
+            drop_dst[i] = state_index[dx, dy]
+    roller_self = sparse.hstack([sparse.identity(n_rollers, format='csr'), sparse.csr_matrix((n_rollers, n_vine))])
+    for dst in (grow_dst, drop_dst):
+        blocks.append(sparse.vstack([roller_self,
+                                     sparse.csr_matrix((np.ones(n_vine), (np.arange(n_vine), dst)), shape=(n_vine, n_states))]))
+
+    mdp = {
+        'key': key,
+        'P': sparse.vstack(blocks).tocsr(),
+        'n_states': n_states,
+        'n_actions': n_actions,
+        'n_rollers': n_rollers,
+        'headings': headings,
+        'state_index': state_index,
+        'cells': cells,
+        'vine_line': np.array(line).reshape(-1, 2),
+    }
+    cache_put(_mdp_cache, key, mdp, MAX_MDPS)
+    if path is not None:
+        save_mdp(mdp, path)
+    return mdp
+
+def save_mdp(mdp, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    P = mdp['P']
+    np.savez_compressed(path, key=mdp['key'], data=P.data, indices=P.indices, indptr=P.indptr, shape=P.shape,
+                        n_actions=mdp['n_actions'], n_rollers=mdp['n_rollers'], headings=mdp['headings'],
+                        state_index=mdp['state_index'], cells=mdp['cells'], vine_line=mdp['vine_line'])
+
+def load_mdp(path):
+    f = np.load(path)
+    P = sparse.csr_matrix((f['data'], f['indices'], f['indptr']), shape=tuple(f['shape']))
+    return {'key': str(f['key']), 'P': P, 'n_states': P.shape[1], 'n_actions': int(f['n_actions']),
+            'n_rollers': int(f['n_rollers']), 'headings': f['headings'], 'state_index': f['state_index'],
+            'cells': f['cells'], 'vine_line': f['vine_line']}
+
+def goal_rewards(mdp, goals, step_cost=0.0):
+    # one reward column per goal: 1 for arriving at the goal cell, -step_cost elsewhere
+    rewards = np.full((mdp['n_states'], len(goals)), -step_cost)
+    for b, goal in enumerate(goals):
+        s = mdp['state_index'][int(round(goal[0])), int(round(goal[1]))]
+        if s >= 0:
+            rewards[s, b] = 1.0
+    return rewards
+
+def value_iteration(mdp, rewards, gamma=0.95, tol=1e-6, max_iter=10000):
+    # rewards: (S,) or (S, B) for B reward functions solved together, reward is paid on arrival
+    rewards = np.asarray(rewards, dtype=float)
+    squeeze = rewards.ndim == 1
+    rewards = rewards.reshape(mdp['n_states'], -1)
+
+    cache_key = (mdp['key'], hashlib.sha1(rewards.tobytes()).hexdigest(), gamma, tol)
+    solution = cache_get(_solution_cache, cache_key)
+    if solution is None:
+        P = mdp['P']
+        n_actions, n_states = mdp['n_actions'], mdp['n_states']
+        V = np.zeros_like(rewards)
+        for _ in range(max_iter):
+            Q = (P @ (rewards + gamma * V)).reshape(n_actions, n_states, -1)
+            V_new = Q.max(axis=0)
+            if np.max(np.abs(V_new - V)) < tol * (1 - gamma) / gamma:
+                V = V_new
+                break
+            V = V_new
+        solution = (V, Q.argmax(axis=0))
+        cache_put(_solution_cache, cache_key, solution, MAX_SOLUTIONS)
+
+    V, policy = solution
+    return (V[:, 0], policy[:, 0]) if squeeze else (V, policy)
+
+def policy_iteration(mdp, rewards, gamma=0.95, policy=None, max_iter=1000):
+    # rewards: (S,) or (S, B) as in value_iteration, policy: (S,) or (S, B) start policies
+    # exact evaluation with one sparse solve per reward column whose policy changed, the
+    # improvement step for all columns in one matmul
+    # from the all-zero default, improvements spread out from the rewards about one cell per
+    # iteration, so it takes on the order of the map diameter; started from a value_iteration
+    # policy it converges in a few
+    P = mdp['P']
+    n_actions, n_states = mdp['n_actions'], mdp['n_states']
+    rewards = np.asarray(rewards, dtype=float)
+    squeeze = rewards.ndim == 1
+    rewards = rewards.reshape(n_states, -1)
+    n_columns = rewards.shape[1]
+    if policy is None:
+        policy = np.zeros((n_states, n_columns), dtype=int)
+    else:
+        policy = np.broadcast_to(np.asarray(policy, dtype=int).reshape(n_states, -1), (n_states, n_columns)).copy()
+    identity = sparse.identity(n_states, format='csr')
+    states = np.arange(n_states)
+
+    V = np.zeros_like(rewards)
+    changed = np.ones(n_columns, dtype=bool)
+    for _ in range(max_iter):
+        for b in np.flatnonzero(changed):
+            P_pi = P[policy[:, b] * n_states + states]
+            V[:, b] = spsolve((identity - gamma * P_pi).tocsc(), P_pi @ rewards[:, b])
+        Q = (P @ (rewards + gamma * V)).reshape(n_actions, n_states, n_columns)
+        # switch only for a gain above the solve's round-off, so ties do not flip back and forth
+        tol = SOLVE_TOL * (1 + np.abs(V).max(axis=0))
+        improve = Q.max(axis=0) > np.take_along_axis(Q, policy[None], axis=0)[0] + tol
+        changed = improve.any(axis=0)
+        if not changed.any():
+            break
+        policy = np.where(improve, Q.argmax(axis=0), policy)
+    else:
+        raise RuntimeError(f"policy iteration did not converge in {max_iter} iterations")
+    return (V[:, 0], policy[:, 0]) if squeeze else (V, policy)
+
+def apply_policy(robots, mdp, policy):
+    # use a solved policy as the controller: point each roller along its state's heading
+    if not robots: return
+    cells = np.rint([robot['position'] for robot in robots]).astype(int)
+    cells = np.clip(cells, 0, np.array(mdp['state_index'].shape) - 1)
+    states = mdp['state_index'][cells[:, 0], cells[:, 1]]
+    n_headings = len(mdp['headings'])
+    for robot, s in zip(robots, states):
+        if s >= 0 and policy[s] < n_headings:
+            robot['orientation'] = mdp['headings'][policy[s]]
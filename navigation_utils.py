@@ -0,0 +1,134 @@
+import numpy as np
+import cnst
+
+from reachability_utils import inflate_obstacles
+
+# goal distance fields over the known map (RQ6 single-target search)
+# unknown cells are treated as free, so a field only ever gets worse when sensing reveals
+# walls; instead of replanning, the cells that lost their support are cleared and the field
+# is relaxed again from what is left (the raise / lower passes of D* Lite), only for the
+# fields robots are actually following
+
+NEIGHBORS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+STEP_COST = [np.hypot(dx, dy) for dx, dy in NEIGHBORS]
+MAX_FIELDS = 8
+HEAT_GOAL_GAIN = 0.05
+
+
+def shifted(a, dx, dy, fill):
+    # out[i, j] = a[i + dx, j + dy]
+    out = np.full_like(a, fill)
+    n_x, n_y = a.shape
+    out[max(-dx, 0):n_x + min(-dx, 0), max(-dy, 0):n_y + min(-dy, 0)] = \
+        a[max(dx, 0):n_x + min(dx, 0), max(dy, 0):n_y + min(dy, 0)]
+    return out
+
+def neighbor_best(field):
+    # cheapest neighbour value plus step cost, for every cell at once
+    best = np.full_like(field, np.inf)
+    for (dx, dy), cost in zip(NEIGHBORS, STEP_COST):
+        np.minimum(best, shifted(field, dx, dy, np.inf) + cost, out=best)
+    return best
+
+def relax(field, blocked):
+    # wavefront: lower every cell to its best neighbour until nothing changes
+    while True:
+        lowered = np.minimum(field, neighbor_best(field))
+        lowered[blocked] = np.inf
+        if np.array_equal(lowered, field):
+            return field
+        field = lowered
+
+def compute_field(blocked, goal):
+    field = np.full(blocked.shape, np.inf)
+    if not blocked[goal]:
+        field[goal] = 0.0
+    return relax(field, blocked)
+
+def repair_field(field, blocked, newly_blocked, goal):
+    field = field.copy()
+    field[newly_blocked] = np.inf
+    if blocked[goal]:
+        return np.full(blocked.shape, np.inf)
+
+    # raise: clear cells whose value no neighbour can explain any more, then their dependants
+    while True:
+        orphaned = np.isfinite(field) & (neighbor_best(field) > field + 1e-9)
+        orphaned[goal] = False
+        if not orphaned.any():
+            break
+        field[orphaned] = np.inf
+
+    # lower: re-relax from the surviving values
+    return relax(field, blocked)
+
+def create_navigator(shape, robot_diameter=None):
+    robot_diameter = cnst.ROBOT_DIAM if robot_diameter is None else robot_diameter
+    blocked = inflate_obstacles(np.zeros(shape, dtype=bool), robot_diameter)
+    # fields: goal cell -> (field, the blocked mask it is valid for)
+    return {'robot_diameter': robot_diameter, 'blocked': blocked, 'fields': {}}
+
+def goal_cell(goal):
+    return int(round(goal[0])), int(round(goal[1]))
+
+def field_for(nav, goal):
+    # one field per goal cell, shared by every robot heading there, repaired when it is used
+    # for the walls revealed since it was last brought up to date
+    goal = goal_cell(goal)
+    if goal not in nav['fields']:
+        if len(nav['fields']) >= MAX_FIELDS:
+            nav['fields'].pop(next(iter(nav['fields'])))
+        field = compute_field(nav['blocked'], goal)
+    else:
+        field, blocked = nav['fields'][goal]
+        if blocked is not nav['blocked']:
+            field = repair_field(field, nav['blocked'], nav['blocked'] & ~blocked, goal)
+    nav['fields'][goal] = (field, nav['blocked'])
+    return field
+
+def update_navigator(nav, known_map):
+    # take in walls sensing has revealed, a new blocked mask only when there are any so
+    # fields that are still valid keep matching it
+    blocked = inflate_obstacles(known_map == 0, nav['robot_diameter'])
+    if (blocked & ~nav['blocked']).any():
+        nav['blocked'] = blocked
+
+def best_heat_goal(known_heat_map, current=None, min_gain=HEAT_GOAL_GAIN, reached=()):
+    # hottest known reading outside the reached cells, but a current goal is only given up for
+    # one at least min_gain hotter, so the goal (and its field) does not chase every slightly
+    # better reading
+    if reached:
+        known_heat_map = known_heat_map.copy()
+        known_heat_map[tuple(np.array(reached).T)] = -1
+    if np.max(known_heat_map) < 0:
+        return None
+    best = tuple(int(i) for i in np.unravel_index(np.argmax(known_heat_map), known_heat_map.shape))
+    if current is not None and known_heat_map[best] < known_heat_map[current] + min_gain:
+        return current
+    return best
+
+def steer_robots(robots, nav, goal_radius=1.5):
+    # point robots with a 'goal' down their field, move_robot then adds its usual jitter
+    by_goal = {}
+    for robot in robots:
+        if robot.get('goal') is not None:
+            by_goal.setdefault(goal_cell(robot['goal']), []).append(robot)
+    for goal in [goal for goal in nav['fields'] if goal not in by_goal]:
+        del nav['fields'][goal]  # nobody heads there any more
+
+    offsets = np.array(NEIGHBORS)
+    for goal, group in by_goal.items():
+        field = field_for(nav, goal)
+        padded = np.pad(field, 1, constant_values=np.inf)
+        cells = np.rint([robot['position'] for robot in group]).astype(int)
+        cells = np.clip(cells, 0, np.array(field.shape) - 1)
+
+        here = field[cells[:, 0], cells[:, 1]]
+        around = padded[cells[:, 0, None] + offsets[:, 0] + 1, cells[:, 1, None] + offsets[:, 1] + 1]
+        best = np.argmin(around, axis=1)
+
+        for robot, value, k, options in zip(group, here, best, around):
+            if value <= goal_radius:
+                robot['goal'] = None  # arrived
+            elif np.isfinite(options[k]):
+                robot['orientation'] = np.arctan2(offsets[k, 1], offsets[k, 0]) % (2 * np.pi)
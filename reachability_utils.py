@@ -0,0 +1,86 @@
+import numpy as np
+from scipy import ndimage
+import cnst
+
+from map_utils import floor_plan_key
+
+# configuration space of a rescue roller: which (integer) robot positions clear the walls
+# the same way check_collision does, split into connected components so "how much can a
+# robot dropped at p reach" and "can p get to q" are lookups instead of random walks
+
+MAX_CACHED = 32  # maps kept, the least recently used is dropped first
+_reachability_cache = {}
+
+
+def collision_offsets(robot_diameter):
+    # wall cells (dx, dy) away from an integer position whose centers are inside the robot
+    robot_radius = robot_diameter / 2
+    lo, hi = int(np.floor(-robot_radius)), int(np.ceil(robot_radius))
+    offsets = [(dx, dy)
+               for dx in range(lo, hi + 1)
+               for dy in range(lo, hi + 1)
+               if (dx + 0.5) ** 2 + (dy + 0.5) ** 2 < robot_radius ** 2]
+    return offsets, lo, hi
+
+def inflate_obstacles(wall_mask, robot_diameter):
+    # True where a robot centred on the cell index would hit a wall or leave the map
+    wall_mask = np.asarray(wall_mask, dtype=bool)
+    n_x, n_y = wall_mask.shape
+    offsets, lo, hi = collision_offsets(robot_diameter)
+
+    blocked = np.zeros_like(wall_mask)
+    for dx, dy in offsets:
+        src = wall_mask[max(dx, 0):n_x + min(dx, 0), max(dy, 0):n_y + min(dy, 0)]
+        blocked[max(-dx, 0):n_x + min(-dx, 0), max(-dy, 0):n_y + min(-dy, 0)] |= src
+
+    # check_collision treats any cell of the bounding box outside the map as a wall
+    blocked[:max(-lo, 0), :] = True
+    blocked[:, :max(-lo, 0)] = True
+    blocked[n_x - hi:, :] = True
+    blocked[:, n_y - hi:] = True
+    return blocked
+
+def get_reachability(floor_plan, robot_diameter=None):
+    robot_diameter = cnst.ROBOT_DIAM if robot_diameter is None else robot_diameter
+    key = (floor_plan_key(floor_plan), float(robot_diameter))
+    if key in _reachability_cache:
+        _reachability_cache[key] = _reachability_cache.pop(key)  # most recently used goes last
+        return _reachability_cache[key]
+
+    free = ~inflate_obstacles(np.asarray(floor_plan) == 0, robot_diameter)
+    # robots step one cell length in any direction, so diagonal neighbours connect
+    labels, n_components = ndimage.label(free, structure=np.ones((3, 3), dtype=int))
+    sizes = np.bincount(labels.ravel(), minlength=n_components + 1)
+    sizes[0] = 0
+
+    reach = {'free': free, 'labels': labels, 'sizes': sizes, 'n_components': n_components,
+             'robot_diameter': robot_diameter}
+    if len(_reachability_cache) >= MAX_CACHED:
+        _reachability_cache.pop(next(iter(_reachability_cache)))
+    _reachability_cache[key] = reach
+    return reach
+
+def label_at(reach, point):
+    # component of the grid position nearest to point, 0 if blocked
+    labels = reach['labels']
+    int_x, int_y = int(round(point[0])), int(round(point[1]))
+    if 0 <= int_x < labels.shape[0] and 0 <= int_y < labels.shape[1]:
+        return int(labels[int_x, int_y])
+    return 0
+
+def is_placeable(reach, point):
+    return label_at(reach, point) != 0
+
+def reachable_area(reach, point):
+    return int(reach['sizes'][label_at(reach, point)])
+
+def reachable_mask(reach, points):
+    # union of the components containing any of the points
+    points = [points] if np.ndim(points) == 1 else points
+    point_labels = [label_at(reach, point) for point in points]
+    point_labels = [label for label in point_labels if label != 0]
+    return np.isin(reach['labels'], point_labels)
+
+def is_connected(reach, p, q):
+    label = label_at(reach, p)
+    return label != 0 and label == label_at(reach, q)
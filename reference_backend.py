@@ -0,0 +1,136 @@
+import numpy as np
+
+# frozen pure-python reference for the differential harness (backend_diff.py)
+# these are copies of check_collision, sense_environment, move_robot and move_vine_robot
+# with the semantics every fast backend has to match: int(round(...)) cells, half-cell
+# centres, the forward move then the shuffled +90 / -90 / 180 bump turns, robots moved in
+# list order; no caching, scheduler, terrain or printing
+# do not optimise or "fix" anything here, change it only together with the semantics
+
+
+def check_collision(position, current_robot, robots, floor_plan, robot_diameter):
+    x, y = position
+    robot_radius = robot_diameter / 2
+
+    x_min = int(np.floor(x - robot_radius))
+    x_max = int(np.ceil(x + robot_radius))
+    y_min = int(np.floor(y - robot_radius))
+    y_max = int(np.ceil(y + robot_radius))
+
+    for xi in range(x_min, x_max + 1):
+        for yi in range(y_min, y_max + 1):
+            if 0 <= xi < floor_plan.shape[0] and 0 <= yi < floor_plan.shape[1]:
+                if floor_plan[xi, yi] == 0:
+                    dx = xi + 0.5 - x
+                    dy = yi + 0.5 - y
+                    if np.sqrt(dx ** 2 + dy ** 2) < robot_radius:
+                        return True
+            else:
+                return True
+
+    for other_robot in robots:
+        if other_robot is not current_robot:
+            other_x, other_y = other_robot['position']
+            if np.sqrt((other_x - x) ** 2 + (other_y - y) ** 2) < robot_diameter:
+                return True
+    return False
+
+def get_heat_at_position(position, heat_source_position, grid_shape):
+    x_pos, y_pos = position
+    x_source, y_source = heat_source_position
+    distance = np.sqrt((x_pos - x_source) ** 2 + (y_pos - y_source) ** 2)
+    sigma = max(grid_shape) / 5
+    return np.exp(-distance ** 2 / (2 * sigma ** 2))
+
+def sense_environment(robots, floor_plan, known_map, heat_map_enabled, heat_source_position, known_heat_map,
+                      robot_diameter, cone_angle, cone_length, n_rays=100, n_steps=50):
+    cone_points_list = []
+    for robot in robots:
+        x, y = robot['position']
+        cone_points = []
+        robot_radius = robot_diameter / 2
+        heat = robot['sensors'].get('Heat Sensor', False) and heat_map_enabled and heat_source_position is not None
+
+        if robot['sensors'].get('Cone Vision', False):
+            orientation = robot['orientation']
+            for angle_offset in np.linspace(-cone_angle / 2, cone_angle / 2, n_rays):
+                angle = orientation + angle_offset
+                for distance in np.linspace(0.5, cone_length, n_steps):
+                    new_x = x + distance * np.cos(angle)
+                    new_y = y + distance * np.sin(angle)
+                    int_new_x = int(round(new_x))
+                    int_new_y = int(round(new_y))
+                    if 0 <= int_new_x < floor_plan.shape[0] and 0 <= int_new_y < floor_plan.shape[1]:
+                        if floor_plan[int_new_x, int_new_y] == 0:
+                            known_map[int_new_x, int_new_y] = 0
+                            if heat:
+                                known_heat_map[int_new_x, int_new_y] = get_heat_at_position((int_new_x, int_new_y), heat_source_position, floor_plan.shape)
+                            cone_points.append((new_x, new_y))
+                            break
+                        known_map[int_new_x, int_new_y] = 1
+                        if heat:
+                            known_heat_map[int_new_x, int_new_y] = get_heat_at_position((int_new_x, int_new_y), heat_source_position, floor_plan.shape)
+                        cone_points.append((new_x, new_y))
+        else:
+            x_min = int(np.floor(x - robot_radius))
+            x_max = int(np.ceil(x + robot_radius))
+            y_min = int(np.floor(y - robot_radius))
+            y_max = int(np.ceil(y + robot_radius))
+            for xi in range(x_min, x_max + 1):
+                for yi in range(y_min, y_max + 1):
+                    if 0 <= xi < floor_plan.shape[0] and 0 <= yi < floor_plan.shape[1]:
+                        dx = xi + 0.5 - x
+                        dy = yi + 0.5 - y
+                        if np.sqrt(dx ** 2 + dy ** 2) <= robot_radius:
+                            known_map[xi, yi] = 0 if floor_plan[xi, yi] == 0 else 1
+                            if heat:
+                                known_heat_map[xi, yi] = get_heat_at_position((xi, yi), heat_source_position, floor_plan.shape)
+        cone_points_list.append(cone_points)
+    return known_map, cone_points_list, known_heat_map
+
+def move_robot(robots, floor_plan, robot_diameter):
+    for robot in robots:
+        x, y = robot['position']
+        orientation = (robot['orientation'] + np.random.uniform(-np.pi / 18, np.pi / 18)) % (2 * np.pi)
+        robot['orientation'] = orientation
+
+        dx, dy = np.cos(orientation), np.sin(orientation)
+        new_position = (x + dx, y + dy)
+        if not check_collision(new_position, robot, robots, floor_plan, robot_diameter):
+            robot['position'] = new_position
+            robot['distance_traveled'] += np.sqrt(dx ** 2 + dy ** 2)
+            robot['stuck_steps'] = 0
+            continue
+
+        rotation_angles = [np.pi / 2, -np.pi / 2, np.pi]
+        np.random.shuffle(rotation_angles)
+        moved = False
+        for angle in rotation_angles:
+            new_orientation = (orientation + angle) % (2 * np.pi)
+            dx, dy = np.cos(new_orientation), np.sin(new_orientation)
+            new_position = (x + dx, y + dy)
+            if not check_collision(new_position, robot, robots, floor_plan, robot_diameter):
+                robot['orientation'] = new_orientation
+                robot['position'] = new_position
+                robot['distance_traveled'] += np.sqrt(dx ** 2 + dy ** 2)
+                moved = True
+                break
+
+        if moved:
+            robot['stuck_steps'] = 0
+        else:
+            robot['stuck_steps'] += 1
+
+def move_vine_robot(vine_robot, floor_plan):
+    if not vine_robot['active']: return
+    x, y = vine_robot['positions'][-1]
+    orientation = vine_robot['orientation']
+    new_x = x + np.cos(orientation)
+    new_y = y + np.sin(orientation)
+    int_new_x, int_new_y = int(round(new_x)), int(round(new_y))
+    if (0 <= int_new_x < floor_plan.shape[0]
+            and 0 <= int_new_y < floor_plan.shape[1]
+            and floor_plan[int_new_x, int_new_y] == 1):
+        vine_robot['positions'].append((new_x, new_y))
+    else:
+        vine_robot['active'] = False
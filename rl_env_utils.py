@@ -0,0 +1,207 @@
+import numpy as np
+import cnst
+
+from batch_utils import grid_lookup, wall_collisions, cone_directions, cast_rays, heat_field
+from reachability_utils import get_reachability
+from map_gen_utils import generate_maps
+
+# B independent simulations stepped together for RL training
+# all state is stacked numpy arrays (env, robot, ...), one call steps every env, envs that
+# finish are reset in place and training code never sees a finished env
+# actions are one heading per robot; movement follows move_robot (heading jitter, first free
+# of the shuffled bump turns, robots move in list order so later robots see earlier moves)
+# reward is the number of cells the team learned by this step's moves
+
+BUMP_ANGLES = np.array([np.pi / 2, -np.pi / 2, np.pi])
+
+
+def make_vec_env(n_envs, n_robots=4, map_pool=None, map_params=None, max_steps=500, patch_size=11,
+                 n_rays=16, n_steps=None, coverage_target=0.95, seed=0):
+    if map_pool is None:
+        map_pool = generate_maps(range(seed, seed + n_envs), map_params, processes=1, cache_dir=None)
+    pool_plans = np.stack([np.asarray(floor_plan) for floor_plan in map_pool]).astype(np.int8)
+    pool_free = np.stack([get_reachability(floor_plan, cnst.ROBOT_DIAM)['free'] for floor_plan in map_pool])
+    shape = pool_plans.shape[1:]
+
+    env = {
+        'n_envs': n_envs,
+        'n_robots': n_robots,
+        'shape': shape,
+        'max_steps': max_steps,
+        'patch_size': patch_size,
+        'n_rays': n_rays,
+        'n_steps': 2 * int(np.ceil(cnst.CONE_LENGTH)) if n_steps is None else n_steps,
+        'coverage_target': coverage_target,
+        'rng': np.random.default_rng(seed),
+        'pool_plans': pool_plans,
+        'pool_free': pool_free,
+        'pool_free_cells': (pool_plans == 1).reshape(len(pool_plans), -1).sum(axis=1),
+        # per env state
+        'map_id': np.zeros(n_envs, dtype=int),
+        'floor_plans': np.zeros((n_envs,) + shape, dtype=np.int8),
+        'known_maps': np.full((n_envs,) + shape, -1, dtype=np.int8),
+        'heat_maps': np.zeros((n_envs,) + shape, dtype=np.float32),
+        'known_free': np.zeros(n_envs, dtype=int),
+        'unknown': np.zeros(n_envs, dtype=int),
+        'positions': np.zeros((n_envs, n_robots, 2)),
+        'orientations': np.zeros((n_envs, n_robots)),
+        'distance_traveled': np.zeros((n_envs, n_robots)),
+        'vine_tip': np.zeros((n_envs, 2)),
+        'vine_orientation': np.zeros(n_envs),
+        'vine_active': np.zeros(n_envs, dtype=bool),
+        'steps': np.zeros(n_envs, dtype=int),
+    }
+    reset_envs(env)
+    return env
+
+def spawn_robots(env, envs):
+    # n_robots free configuration cells per env, at least one diameter apart
+    rng, n_robots = env['rng'], env['n_robots']
+    for b in envs:
+        free_cells = np.flatnonzero(env['pool_free'][env['map_id'][b]])
+        candidates = np.column_stack(np.unravel_index(rng.choice(free_cells, size=min(len(free_cells), 8 * n_robots)),
+                                                      env['shape'])).astype(float)
+        chosen = [candidates[0]]
+        for cell in candidates[1:]:
+            if len(chosen) == n_robots:
+                break
+            if np.min(np.hypot(*(np.array(chosen) - cell).T)) >= cnst.ROBOT_DIAM:
+                chosen.append(cell)
+        while len(chosen) < n_robots:
+            chosen.append(chosen[-1])  # tiny maps only
+        env['positions'][b] = chosen
+
+def reset_envs(env, mask=None):
+    envs = np.arange(env['n_envs']) if mask is None else np.flatnonzero(mask)
+    if len(envs) == 0:
+        return observations(env)
+    rng = env['rng']
+    n = len(envs)
+
+    env['map_id'][envs] = rng.integers(0, len(env['pool_plans']), size=n)
+    env['floor_plans'][envs] = env['pool_plans'][env['map_id'][envs]]
+    env['known_maps'][envs] = -1
+    env['known_free'][envs] = 0
+    env['unknown'][envs] = np.prod(env['shape'])
+    env['steps'][envs] = 0
+    env['distance_traveled'][envs] = 0.0
+    env['orientations'][envs] = rng.uniform(0, 2 * np.pi, size=(n, env['n_robots']))
+    spawn_robots(env, envs)
+
+    # heat source somewhere free, the vine starts where the first robot was dropped
+    for b in envs:
+        free_cells = np.flatnonzero(env['floor_plans'][b] == 1)
+        source = np.unravel_index(rng.choice(free_cells), env['shape'])
+        env['heat_maps'][b] = heat_field(env['shape'], source)
+    env['vine_tip'][envs] = env['positions'][envs, 0]
+    env['vine_orientation'][envs] = rng.uniform(0, 2 * np.pi, size=n)
+    env['vine_active'][envs] = True
+    sense(env, envs)  # what the robots see where they are dropped is not any action's reward
+    return observations(env)
+
+def move_robots(env, headings, jitter=None, order=None):
+    # move_robot for every env at once; the loop is over robots (list order), not envs
+    # jitter (env, robot) and bump order (env, robot, 3) are drawn from env['rng'] unless given
+    rng = env['rng']
+    n_envs, n_robots = env['n_envs'], env['n_robots']
+    radius = cnst.ROBOT_DIAM / 2
+    env_index = np.repeat(np.arange(n_envs), n_robots)
+    is_wall = grid_lookup(env['floor_plans'], np.repeat(env_index, 4))
+
+    if jitter is None:
+        jitter = rng.uniform(-np.pi / 18, np.pi / 18, size=headings.shape)
+    if order is None:
+        order = rng.permuted(np.tile(np.arange(3), (n_envs, n_robots, 1)), axis=-1)
+    orientation = (headings + jitter) % (2 * np.pi)
+    # candidate headings: forward, then the bump turns in shuffled order
+    candidates = np.concatenate([orientation[..., None], (orientation[..., None] + BUMP_ANGLES[order]) % (2 * np.pi)], axis=-1)
+    targets = env['positions'][:, :, None, :] + np.stack([np.cos(candidates), np.sin(candidates)], axis=-1)
+
+    wall_hit = wall_collisions(targets.reshape(-1, 2), radius, env['shape'], is_wall).reshape(n_envs, n_robots, 4)
+
+    positions = env['positions'].copy()
+    for i in range(n_robots):
+        others = np.delete(positions, i, axis=1)  # robots before i have already moved
+        dist = np.sqrt(np.sum((targets[:, i, :, None, :] - others[:, None, :, :]) ** 2, axis=-1))
+        free = ~wall_hit[:, i] & ~np.any(dist < cnst.ROBOT_DIAM, axis=-1)
+        moved = free.any(axis=1)
+        first = np.argmax(free, axis=1)
+        rows = np.flatnonzero(moved)
+        positions[rows, i] = targets[rows, i, first[rows]]
+        orientation[rows, i] = candidates[rows, i, first[rows]]
+        env['distance_traveled'][rows, i] += 1.0
+
+    env['positions'] = positions
+    env['orientations'] = orientation
+
+def grow_vines(env):
+    # move_vine_robot for every active vine
+    active = np.flatnonzero(env['vine_active'])
+    tips = env['vine_tip'][active] + np.column_stack([np.cos(env['vine_orientation'][active]),
+                                                       np.sin(env['vine_orientation'][active])])
+    cells = np.rint(tips).astype(int)
+    inside = np.all((cells >= 0) & (cells < np.array(env['shape'])), axis=1)
+    ok = np.zeros(len(active), dtype=bool)
+    ok[inside] = env['floor_plans'][active[inside], cells[inside, 0], cells[inside, 1]] == 1
+    env['vine_tip'][active[ok]] = tips[ok]
+    env['vine_active'][active[~ok]] = False
+
+def sense(env, envs=None):
+    # cone vision for every robot of envs (all by default), returns the newly known cell count
+    # per env; cast_rays directly so the seen samples go into the stacked known maps by flat index
+    envs = np.arange(env['n_envs']) if envs is None else envs
+    n_robots = env['n_robots']
+    n_x, n_y = env['shape']
+    env_index = np.repeat(envs, n_robots)
+    directions = cone_directions(env['orientations'][envs].ravel(), n_rays=env['n_rays'])
+    distances = np.linspace(0.5, cnst.CONE_LENGTH, env['n_steps'])
+    _, cells, seen, wall = cast_rays(env['positions'][envs].reshape(-1, 2), directions, distances, env['shape'],
+                                     grid_lookup(env['floor_plans'], env_index))
+    flat = ((env_index[:, None, None] * n_x + cells[0]) * n_y + cells[1])[seen]
+    env['known_maps'].reshape(-1)[flat] = ~wall[seen]
+
+    # rays overlap, so count from the maps rather than the samples
+    known = env['known_maps'][envs].reshape(len(envs), -1)
+    unknown = np.count_nonzero(known == -1, axis=1)
+    gained = env['unknown'][envs] - unknown
+    env['unknown'][envs] = unknown
+    env['known_free'][envs] = np.count_nonzero(known == 1, axis=1)
+    return gained
+
+def observations(env):
+    # local known-map patch around each robot (outside the map reads as wall), heat at the
+    # robot's cell, and pose scaled to the map
+    half = env['patch_size'] // 2
+    padded = np.pad(env['known_maps'], ((0, 0), (half, half), (half, half)), constant_values=0)
+    cells = np.rint(env['positions']).astype(int)
+    cells = np.clip(cells, 0, np.array(env['shape']) - 1)
+    offsets = np.arange(-half, half + 1)
+    xs = cells[:, :, 0, None, None] + offsets[None, None, :, None] + half
+    ys = cells[:, :, 1, None, None] + offsets[None, None, None, :] + half
+    envs = np.arange(env['n_envs'])[:, None, None, None]
+    patches = padded[envs, xs, ys]
+
+    heat = env['heat_maps'][np.arange(env['n_envs'])[:, None], cells[:, :, 0], cells[:, :, 1]]
+    pose = np.concatenate([env['positions'] / np.array(env['shape']),
+                           np.cos(env['orientations'])[..., None], np.sin(env['orientations'])[..., None]], axis=-1)
+    return {'patches': patches, 'heat': heat, 'pose': pose}
+
+def coverage(env):
+    return env['known_free'] / env['pool_free_cells'][env['map_id']]
+
+def step_envs(env, actions):
+    # actions: (n_envs, n_robots) headings in radians, the reward is what the moves revealed
+    move_robots(env, np.asarray(actions, dtype=float))
+    grow_vines(env)
+    rewards = sense(env).astype(float)
+    env['steps'] += 1
+
+    episode_coverage = coverage(env)
+    dones = (env['steps'] >= env['max_steps']) | (episode_coverage >= env['coverage_target'])
+    infos = {'coverage': episode_coverage, 'steps': env['steps'].copy()}
+    obs = observations(env)
+    if dones.any():
+        # last observation of each finished episode (rows of dones), before it is reset
+        infos['terminal_obs'] = {key: value[dones] for key, value in obs.items()}
+        obs = reset_envs(env, dones)
+    return obs, rewards, dones, infos
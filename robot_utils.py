@@ -1,6 +1,37 @@
 import numpy as np
 import cnst
 
+from terrain_utils import lookup
+
+def create_robot(position, orientation, sensors):
+    return {
+        'position': position,
+        'orientation': orientation,
+        'sensors': dict(sensors),
+        'distance_traveled': 0.0,
+        'effort': 0.0,
+        'stuck_steps': 0,
+        'sleep_until': None
+    }
+
+def create_scheduler(sleep_steps=20, patience=5, wake_radius=None):
+    # active set for move_robot: a robot sleeps only once no heading at all can free it (see
+    # boxed_in), until its timer runs out or a robot near it moves away, so runs match
+    # move_robot without a scheduler; walls and terrain never change, only robots can free it
+    # the heading is re-jittered every step, so failing the four tries is not enough; the
+    # full check is only done every patience failed steps in a row
+    # asleep robots turn by their jitter, draw their bump order and count stuck_steps just
+    # like a robot that tried and failed, so the random stream stays the same
+    if wake_radius is None:
+        wake_radius = cnst.ROBOT_DIAM + 1 + 1e-6  # one step + one diameter
+    return {'step': 0, 'sleep_steps': sleep_steps, 'patience': patience, 'wake_radius': wake_radius}
+
+def wake_sleepers(sleepers, sleeper_positions, position, wake_radius):
+    if not sleepers: return
+    dist = np.hypot(sleeper_positions[:, 0] - position[0], sleeper_positions[:, 1] - position[1])
+    for i in np.flatnonzero(dist < wake_radius):
+        sleepers[i]['sleep_until'] = None
+
 def check_collision(position, current_robot, robots, floor_plan, robot_diameter):
     x, y = position
     robot_radius = robot_diameter / 2
@@ -39,8 +70,87 @@ def check_collision(position, current_robot, robots, floor_plan, robot_diameter)
 
     return False  # No collision
 
-def move_robot(robots, floor_plan):
-    for robot in robots:
+def terrain_blocked(position, terrain):
+    # rollers cannot enter cells they have no speed on (gaps)
+    if terrain is None: return False
+    return terrain['roller_speed'][int(round(position[0])), int(round(position[1]))] == 0
+
+def circle_crossings(position, speed, centres, radius):
+    # headings at which the step circle enters or leaves discs of radius around centres
+    if len(centres) == 0: return np.zeros(0)
+    offset = np.asarray(centres, dtype=float) - position
+    dist = np.hypot(offset[:, 0], offset[:, 1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        k = (speed ** 2 + dist ** 2 - radius ** 2) / (2 * speed * dist)
+    inside = np.abs(k) < 1
+    phi = np.arctan2(offset[inside, 1], offset[inside, 0])
+    half = np.arccos(k[inside])
+    return np.concatenate([phi - half, phi + half])
+
+def line_crossings(position, speed, x_lines, y_lines):
+    # headings at which the step circle crosses the lines x = x_lines and y = y_lines
+    u = (np.asarray(x_lines, dtype=float) - position[0]) / speed
+    v = (np.asarray(y_lines, dtype=float) - position[1]) / speed
+    a, b = np.arccos(u[np.abs(u) <= 1]), np.arcsin(v[np.abs(v) <= 1])
+    return np.concatenate([a, -a, b, np.pi - b])
+
+def boxed_in(robot, robots, floor_plan, speed, terrain=None):
+    # True if a step of this length collides at every heading; the outcome can only change
+    # where the step circle crosses a wall cell or robot disc, the map border margin or (with
+    # terrain) a cell boundary, so one heading between each pair of crossings covers them all
+    x, y = robot['position']
+    robot_radius = cnst.ROBOT_DIAM / 2
+    if speed == 0:
+        headings = np.zeros(1)
+    else:
+        reach = speed + cnst.ROBOT_DIAM
+        x_min, y_min = max(int(np.floor(x - reach)), 0), max(int(np.floor(y - reach)), 0)
+        walls = np.argwhere(floor_plan[x_min:int(np.ceil(x + reach)) + 1, y_min:int(np.ceil(y + reach)) + 1] == 0)
+        others = [other['position'] for other in robots if other is not robot]
+        x_lines = [robot_radius, floor_plan.shape[0] - 1 - robot_radius]
+        y_lines = [robot_radius, floor_plan.shape[1] - 1 - robot_radius]
+        if terrain is not None:
+            x_lines += list(np.arange(np.floor(x - speed), np.ceil(x + speed) + 1) + 0.5)
+            y_lines += list(np.arange(np.floor(y - speed), np.ceil(y + speed) + 1) + 0.5)
+        crossings = np.sort(np.concatenate([
+            circle_crossings((x, y), speed, walls + (x_min + 0.5, y_min + 0.5), robot_radius),
+            circle_crossings((x, y), speed, others, cnst.ROBOT_DIAM),
+            line_crossings((x, y), speed, x_lines, y_lines)]) % (2 * np.pi))
+        if len(crossings) == 0:
+            headings = np.zeros(1)
+        else:
+            headings = (crossings + np.append(crossings[1:], crossings[0] + 2 * np.pi)) / 2
+    for heading in headings:
+        new_position = (x + speed * np.cos(heading), y + speed * np.sin(heading))
+        if not (check_collision(new_position, robot, robots, floor_plan, cnst.ROBOT_DIAM)
+                or terrain_blocked(new_position, terrain)):
+            return False
+    return True
+
+def move_robot(robots, floor_plan, scheduler=None, terrain=None):
+    # step length and effort per cell come from the terrain tables, gathered for all robots at once
+    if terrain is not None:
+        positions = [robot['position'] for robot in robots]
+        speeds = lookup(terrain['roller_speed'], positions)
+        costs = lookup(terrain['roller_cost'], positions)
+    else:
+        speeds = costs = np.ones(len(robots))
+
+    if scheduler is not None:
+        step = scheduler['step']
+        scheduler['step'] += 1
+        sleepers = [robot for robot in robots if robot['sleep_until'] is not None]
+        sleeper_positions = np.array([robot['position'] for robot in sleepers]).reshape(-1, 2)
+
+    for i, robot in enumerate(robots):
+        if scheduler is not None and robot['sleep_until'] is not None:
+            if step < robot['sleep_until']:
+                robot['orientation'] = (robot['orientation'] + np.random.uniform(-np.pi / 18, np.pi / 18)) % (2 * np.pi)
+                np.random.shuffle([np.pi / 2, -np.pi / 2, np.pi])
+                robot['stuck_steps'] += 1
+                continue
+            robot['sleep_until'] = None
+
         x, y = robot['position']
         orientation = robot['orientation']
         
@@ -50,44 +160,69 @@ def move_robot(robots, floor_plan):
         robot['orientation'] = orientation
         
         # move forward in new orientation
-        dx, dy = np.cos(orientation), np.sin(orientation)
+        dx, dy = speeds[i] * np.cos(orientation), speeds[i] * np.sin(orientation)
         new_x = x + dx
         new_y = y + dy
         new_position = (new_x, new_y)
         
         # check if possible
-        if not check_collision(new_position, robot, robots, floor_plan, cnst.ROBOT_DIAM):
+        if not (check_collision(new_position, robot, robots, floor_plan, cnst.ROBOT_DIAM)
+                or terrain_blocked(new_position, terrain)):
             robot['position'] = new_position
             # Update distance_traveled
             distance = np.sqrt(dx**2 + dy**2)
             robot['distance_traveled'] += distance
+            robot['effort'] += distance * costs[i]
+            robot['stuck_steps'] = 0
+            if scheduler is not None: wake_sleepers(sleepers, sleeper_positions, (x, y), scheduler['wake_radius'])
             continue 
         
         # else bumped into something so rotate
         rotation_angles = [np.pi / 2, -np.pi / 2, np.pi]
         np.random.shuffle(rotation_angles)
 
+        moved = False
         for angle in rotation_angles:
             new_orientation = (orientation + angle) % (2 * np.pi)
-            dx, dy = np.cos(new_orientation), np.sin(new_orientation)
+            dx, dy = speeds[i] * np.cos(new_orientation), speeds[i] * np.sin(new_orientation)
             new_x = x + dx
             new_y = y + dy
             new_position = (new_x, new_y)
 
-            if not check_collision(new_position, robot, robots, floor_plan, cnst.ROBOT_DIAM):
+            if not (check_collision(new_position, robot, robots, floor_plan, cnst.ROBOT_DIAM)
+                    or terrain_blocked(new_position, terrain)):
                 robot['orientation'] = new_orientation
                 robot['position'] = new_position
                 # Update distance_traveled
                 distance = np.sqrt(dx**2 + dy**2)
                 robot['distance_traveled'] += distance
-                continue 
+                robot['effort'] += distance * costs[i]
+                moved = True
+                break
+
+        if moved:
+            robot['stuck_steps'] = 0
+            if scheduler is not None: wake_sleepers(sleepers, sleeper_positions, (x, y), scheduler['wake_radius'])
+            continue
 
         # stay in place
+        robot['stuck_steps'] += 1
+        if (scheduler is not None and robot['stuck_steps'] % scheduler['patience'] == 0
+                and boxed_in(robot, robots, floor_plan, speeds[i], terrain)):
+            robot['sleep_until'] = step + scheduler['sleep_steps']
+            # later robots this step can still free it
+            sleepers.append(robot)
+            sleeper_positions = np.vstack([sleeper_positions, (x, y)])
         print(f"Robot at ({int(round(x))}, {int(round(y))}) cannot move and stays in place.")
 
 def sense_environment(robots, floor_plan, known_map, heat_map_enabled, heat_source_position, known_heat_map):
     cone_points_list = []
     for robot in robots:
+        # same pose as last time means the same cells, so reuse what was sensed
+        sensed_key = (robot['position'], robot['orientation'], id(known_map), id(known_heat_map), heat_map_enabled, heat_source_position)
+        if robot.get('sensed_key') == sensed_key:
+            cone_points_list.append(robot['cone_points'])
+            continue
         
         x, y = robot['position']
         cone_points = []
@@ -137,6 +272,8 @@ def sense_environment(robots, floor_plan, known_map, heat_map_enabled, heat_sour
                                 known_map[xi, yi] = 1  # Free space
                             if robot['sensors'].get('Heat Sensor', False) and heat_map_enabled and heat_source_position is not None:
                                 known_heat_map[xi, yi] = get_heat_at_position((xi, yi), heat_source_position, floor_plan.shape)
+        robot['sensed_key'] = sensed_key
+        robot['cone_points'] = cone_points
         cone_points_list.append(cone_points)
     return known_map, cone_points_list, known_heat_map
 
@@ -0,0 +1,177 @@
+import numpy as np
+import cnst
+
+from map_utils import generate_floor_plan
+from robot_utils import move_robot, sense_environment, create_robot, create_scheduler
+from vine_robot_utils import move_vine_robot, deploy_from_vine
+from event_utils import check_events
+from reachability_utils import get_reachability, reachable_mask
+from terrain_utils import create_terrain
+from energy_utils import create_energy_tracker, update_energy, energy_results
+from navigation_utils import create_navigator, update_navigator, steer_robots, best_heat_goal
+from comm_utils import create_comm, update_comm, comm_results
+from snapshot_utils import thaw
+from heat_filter_utils import create_heat_filter, observe_robots, heat_filter_results
+
+# headless version of the main loop, used for batch runs and sweeps (no plotting)
+
+
+def sensor_dict(sensor_names):
+    # ['Cone Vision'] -> {'Cone Vision': True, 'Heat Sensor': False}
+    return {option: option in sensor_names for option in cnst.SENSOR_OPT}
+
+def create_simulation(scenario):
+    if 'floor_plan' in scenario:
+        floor_plan = np.asarray(scenario['floor_plan'], dtype=float)
+    else:
+        grid_size = tuple(scenario.get('grid_size', cnst.GRID_SIZE))
+        floor_plan = generate_floor_plan(grid_size, scenario.get('walls', cnst.MAP))
+
+    np.random.seed(scenario.get('seed', 0))
+    sleep_steps = scenario.get('sleep_steps')  # set to turn the active-set scheduler on
+
+    sim = {
+        'floor_plan': floor_plan,
+        'known_map': -1 * np.ones(floor_plan.shape),
+        'known_heat_map': -1 * np.ones(floor_plan.shape),
+        'robots': [],
+        'vine_robot': {'positions': [], 'active': False, 'orientation': None},
+        'heat_source_position': scenario.get('heat_source_position'),
+        'heat_map_enabled': scenario.get('heat_source_position') is not None,
+        'pending_drops': [],
+        'drop_offset': scenario.get('drop_offset', 2),
+        'cone_points_list': [],
+        'scheduler': None if sleep_steps is None else create_scheduler(sleep_steps),
+        'terrain': create_terrain(floor_plan, scenario['terrain_zones']) if scenario.get('terrain_zones') else None,
+        'energy': create_energy_tracker(),
+        'energy_per_step': scenario.get('energy_per_step', False),  # per-step summaries in the results
+        'goal': scenario.get('goal'),  # None (random walk), 'heat' (best known reading) or a cell
+        'navigator': create_navigator(floor_plan.shape) if scenario.get('goal') is not None else None,
+        'heat_goal': None,
+        'heat_goals_reached': [],  # never picked again once a robot got there
+        # scenario['heat_filter'] is a dict of create_heat_filter options, {} for the defaults;
+        # its seed is the scenario's unless the options set one
+        'heat_filter': create_heat_filter(floor_plan.shape, free_masks=[floor_plan == 1],
+                                          **{'seed': scenario.get('seed', 0), **scenario['heat_filter']})
+                       if scenario.get('heat_filter') is not None else None,
+        'comm': create_comm(floor_plan.shape, scenario['comm_range']) if scenario.get('comm_range') is not None else None,
+        'events_fired': [],
+        'step': 0,
+    }
+
+    # robots placed directly on the map
+    for position, sensors in scenario.get('robots', []):
+        robot = create_robot(tuple(position), np.random.uniform(0, 2 * np.pi), sensor_dict(sensors))
+        sim['robots'].append(robot)
+
+    # vine robot + rescue rollers dropped from its tip at given steps
+    if scenario.get('vine_start') is not None:
+        sim['vine_robot']['positions'] = [tuple(scenario['vine_start'])]
+        sim['vine_robot']['orientation'] = scenario['vine_orientation']
+        sim['vine_robot']['active'] = True
+
+        team = scenario.get('team', [])
+        drop_steps = scenario.get('drop_steps', [0] * len(team))
+        order = sorted(range(len(team)), key=lambda i: drop_steps[i])
+        sim['pending_drops'] = [(drop_steps[i], sensor_dict(team[i])) for i in order]
+
+    sim['rng_state'] = np.random.get_state()
+    return sim
+
+def deploy_pending(sim):
+    # a drop that is blocked stays pending and is retried next step
+    still_pending = []
+    for drop_step, sensors in sim['pending_drops']:
+        if drop_step <= sim['step'] and sim['vine_robot']['positions']:
+            if deploy_from_vine(sim['vine_robot'], sim['robots'], sim['floor_plan'], sensors, sim['drop_offset']) is not None:
+                continue
+        still_pending.append((drop_step, sensors))
+    sim['pending_drops'] = still_pending
+
+def steer_to_goal(sim):
+    update_navigator(sim['navigator'], sim['known_map'])
+    if sim['goal'] == 'heat':
+        # held until a robot gets there or a clearly hotter reading turns up
+        sim['heat_goal'] = goal = best_heat_goal(sim['known_heat_map'], sim['heat_goal'],
+                                                 reached=sim['heat_goals_reached'])
+    else:
+        goal = sim['goal']
+    if goal is None:
+        return
+    for robot in sim['robots']:
+        robot['goal'] = goal
+    steer_robots(sim['robots'], sim['navigator'])
+    if sim['goal'] == 'heat' and any(robot['goal'] is None for robot in sim['robots']):
+        sim['heat_goals_reached'].append(sim['heat_goal'])
+        sim['heat_goal'] = None
+
+def step_simulation(sim):
+    thaw(sim)  # copy on write after a snapshot or restore, see snapshot_utils
+    # the sim owns its random stream, so interleaved sims (forks, batches) don't share one
+    np.random.set_state(sim['rng_state'])
+    deploy_pending(sim)
+
+    sim['known_map'], sim['cone_points_list'], sim['known_heat_map'] = sense_environment(
+        sim['robots'], sim['floor_plan'], sim['known_map'], sim['heat_map_enabled'],
+        sim['heat_source_position'], sim['known_heat_map'])
+    if sim['comm'] is not None:
+        vine_positions = sim['vine_robot']['positions']
+        update_comm(sim['comm'], sim['robots'], sim['floor_plan'], sim['cone_points_list'],
+                    vine_positions[-1] if vine_positions else None)
+    if sim['heat_filter'] is not None:
+        observe_robots(sim['heat_filter'], sim['robots'], sim['floor_plan'], sim['cone_points_list'], sim['known_heat_map'])
+    if sim['navigator'] is not None:
+        steer_to_goal(sim)
+    move_robot(sim['robots'], sim['floor_plan'], sim['scheduler'], sim['terrain'])
+
+    if sim['vine_robot']['active']: move_vine_robot(sim['vine_robot'], sim['floor_plan'], sim['terrain'])
+
+    update_energy(sim['energy'], sim['robots'], sim['vine_robot'])
+
+    sim['rng_state'] = np.random.get_state()
+    sim['step'] += 1
+
+def run_simulation(sim, max_steps=None, events=None):
+    # stops early once a stop event fires, see event_utils
+    max_steps = cnst.MAX_STEPS if max_steps is None else max_steps
+    while sim['step'] < max_steps:
+        step_simulation(sim)
+        if events and check_events(events, sim):
+            break
+    return simulation_results(sim)
+
+def simulation_results(sim):
+    floor_plan = sim['floor_plan']
+    known_map = sim['known_map']
+    free_cells = np.count_nonzero(floor_plan == 1)
+    known_free = np.count_nonzero(known_map == 1)
+    vine_positions = sim['vine_robot']['positions']
+
+    # coverage of the space the deployed robots can physically get to
+    reachable_coverage = 0.0
+    if sim['robots']:
+        reach = get_reachability(floor_plan, cnst.ROBOT_DIAM)
+        mask = reachable_mask(reach, [robot['position'] for robot in sim['robots']])
+        if mask.any():
+            reachable_coverage = float(np.count_nonzero(known_map[mask] == 1) / np.count_nonzero(mask))
+
+    results = {
+        'steps': int(sim['step']),
+        'coverage': float(np.count_nonzero(known_map != -1) / known_map.size),
+        'free_coverage': float(known_free / free_cells) if free_cells else 0.0,
+        'reachable_coverage': reachable_coverage,
+        'robots_deployed': len(sim['robots']),
+        'drops_pending': len(sim['pending_drops']),
+        'distance_traveled': [float(robot['distance_traveled']) for robot in sim['robots']],
+        'total_distance': float(sum(robot['distance_traveled'] for robot in sim['robots'])),
+        'effort': [float(robot['effort']) for robot in sim['robots']],
+        'vine_length': float(np.sum(np.hypot(*np.diff(np.reshape(vine_positions, (-1, 2)), axis=0).T))),
+        'vine_effort': float(sim['vine_robot'].get('effort', 0.0)),
+        'events': list(sim['events_fired']),
+    }
+    results.update(energy_results(sim['energy'], sim['energy_per_step']))
+    if sim['heat_filter'] is not None:
+        results.update(heat_filter_results(sim['heat_filter'], sim['heat_source_position']))
+    if sim['comm'] is not None:
+        results.update(comm_results(sim['comm'], floor_plan))
+    return results
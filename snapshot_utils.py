@@ -0,0 +1,67 @@
+import copy
+
+import numpy as np
+
+# snapshot / restore / fork of a sim_utils sim, for what-if branches off one warm-up run
+# a snapshot copies the containers (dicts, lists) and shares every numpy array, which is
+# made read-only; step_simulation thaws a sim before it writes, copying only the arrays that
+# are still shared, so forks that are never stepped cost a few dicts each
+# each sim carries its own np.random state (sim['rng_state'], see step_simulation), so forks
+# of one snapshot draw the same numbers however their steps are interleaved
+
+# passed by reference, never walked: replaced rather than written, or not ours to copy
+SHARED_KEYS = {'cone_points', 'cone_points_list', 'sensed_key', 'sink'}
+# walked and frozen, but never thawed since nothing writes into their arrays
+READ_ONLY_KEYS = {'floor_plan', 'terrain', 'navigator'}
+
+
+def freeze(obj):
+    if isinstance(obj, dict):
+        return {key: value if key in SHARED_KEYS else freeze(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [freeze(value) for value in obj]
+    if isinstance(obj, np.ndarray):
+        obj.flags.writeable = False
+        return obj
+    if isinstance(obj, np.random.Generator):
+        return copy.deepcopy(obj)  # a filter's own stream, each copy has to draw the same numbers
+    return obj  # numbers, tuples, strings, None
+
+def thaw(obj):
+    # give a sim its own copy of every array it still shares, in place
+    if isinstance(obj, dict):
+        items = obj.items()
+    elif isinstance(obj, list):
+        items = enumerate(obj)
+    else:
+        return
+    for key, value in items:
+        if isinstance(value, np.ndarray):
+            if not value.flags.writeable:
+                obj[key] = value.copy()
+        elif key not in SHARED_KEYS and key not in READ_ONLY_KEYS:
+            thaw(value)
+
+def snapshot(sim):
+    # the live sim keeps running: its arrays are now shared too, so it thaws on its next step
+    return {'sim': freeze(sim)}
+
+def restore(snap):
+    # a fresh sim sharing the snapshot's arrays, restoring the same snapshot again forks it
+    return freeze(snap['sim'])
+
+def array_bytes(sims):
+    # bytes held by arrays several sims share vs. arrays only one holds, what copy on write saves
+    users = {}
+    def walk(obj):
+        values = obj.values() if isinstance(obj, dict) else obj
+        for value in values:
+            if isinstance(value, np.ndarray):
+                nbytes, count = users.get(id(value), (value.nbytes, 0))
+                users[id(value)] = (nbytes, count + 1)
+            elif isinstance(value, (dict, list)):
+                walk(value)
+    for sim in sims:
+        walk({key: value for key, value in sim.items() if key not in SHARED_KEYS})
+    return {'shared_bytes': sum(nbytes for nbytes, count in users.values() if count > 1),
+            'owned_bytes': sum(nbytes for nbytes, count in users.values() if count == 1)}
@@ -0,0 +1,140 @@
+import os
+import ast
+import json
+import hashlib
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import cnst
+
+from map_utils import generate_floor_plan, floor_plan_key
+from sim_utils import create_simulation, run_simulation
+from event_utils import events_from_spec
+
+# parameter sweeps with an on-disk result store, one json file per scenario
+# a scenario is keyed by (map, seed, parameters, code version) so re-running or
+# extending a sweep only computes the points that are not in the store yet
+
+DEFAULT_STORE = 'sweep_results'
+CODE_ROOTS = ['sim_utils', 'event_utils', 'map_utils']  # what run_scenario calls into
+
+
+def local_imports(name, here, found):
+    # name and every module next to it that it imports, directly or not, as name -> path
+    path = os.path.join(here, name + '.py')
+    if name in found or not os.path.exists(path):
+        return found
+    found[name] = path
+    with open(path, 'rb') as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names = [node.module]
+        else:
+            continue
+        for imported in names:
+            local_imports(imported.split('.')[0], here, found)
+    return found
+
+def code_version():
+    # the sources of every module a run imports, and the constants in cnst, which may live
+    # outside this directory
+    digest = hashlib.sha1()
+    here = os.path.dirname(os.path.abspath(__file__))
+    found = {}
+    for name in CODE_ROOTS:
+        local_imports(name, here, found)
+    for name in sorted(found):
+        with open(found[name], 'rb') as f:
+            digest.update(f.read().replace(b'\r\n', b'\n'))
+    constants = {name: getattr(cnst, name) for name in dir(cnst) if name.isupper()}
+    digest.update(json.dumps(constants, sort_keys=True, default=str).encode())
+    return digest.hexdigest()[:12]
+
+def scenario_floor_plan(scenario):
+    if 'floor_plan' in scenario:
+        return np.asarray(scenario['floor_plan'])
+    return generate_floor_plan(tuple(scenario.get('grid_size', cnst.GRID_SIZE)), scenario.get('walls', cnst.MAP))
+
+def scenario_key(scenario, version=None):
+    # the map goes in by content hash so walls and floor_plan arrays key the same way
+    params = {k: v for k, v in scenario.items() if k not in ('floor_plan', 'walls', 'grid_size')}
+    params['map'] = floor_plan_key(scenario_floor_plan(scenario))
+    params['code'] = code_version() if version is None else version
+    blob = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha1(blob.encode()).hexdigest()
+
+def expand_grid(base_scenario, grid):
+    # grid: {'seed': [0, 1, 2], 'drop_offset': [2, 4], ...} -> every combination
+    names = sorted(grid)
+    for values in itertools.product(*(grid[name] for name in names)):
+        point = dict(zip(names, values))
+        scenario = dict(base_scenario)
+        scenario.update(point)
+        yield point, scenario
+
+def sensor_splits(team_size, sensor_sets=None):
+    # every way of handing out sensor sets to a team, ignoring robot order
+    if sensor_sets is None:
+        sensor_sets = [list(combo)
+                       for n in range(1, len(cnst.SENSOR_OPT) + 1)
+                       for combo in itertools.combinations(cnst.SENSOR_OPT, n)]
+    return [list(team) for team in itertools.combinations_with_replacement(sensor_sets, team_size)]
+
+def result_path(store_dir, key):
+    return os.path.join(store_dir, key[:2], key + '.json')
+
+def load_result(store_dir, key):
+    path = result_path(store_dir, key)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def save_result(store_dir, key, record):
+    # write to a temp file and rename so an interrupted sweep never leaves half a result
+    path = result_path(store_dir, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(record, f, default=str)
+    os.replace(tmp_path, path)
+
+def run_scenario(scenario):
+    sim = create_simulation(scenario)
+    return run_simulation(sim, scenario.get('max_steps'), events_from_spec(scenario.get('stop_when', {})))
+
+def run_sweep(base_scenario, grid, store_dir=DEFAULT_STORE, processes=1):
+    version = code_version()
+    records = []
+    todo = []
+
+    for point, scenario in expand_grid(base_scenario, grid):
+        key = scenario_key(scenario, version)
+        record = load_result(store_dir, key)
+        if record is not None:
+            records.append(record)
+        else:
+            todo.append((key, point, scenario))
+
+    print(f"Sweep: {len(records)} cached, {len(todo)} to run.")
+
+    def finish(key, point, result):
+        record = {'key': key, 'code': version, 'params': point, 'result': result}
+        save_result(store_dir, key, record)
+        records.append(record)
+
+    if processes == 1:
+        for key, point, scenario in todo:
+            finish(key, point, run_scenario(scenario))
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = {pool.submit(run_scenario, scenario): (key, point) for key, point, scenario in todo}
+            for future in as_completed(futures):
+                key, point = futures[future]
+                finish(key, point, future.result())
+
+    return records
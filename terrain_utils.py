@@ -0,0 +1,51 @@
+import numpy as np
+
+# ground types on top of the 0/1 floor plan (README item 3)
+# each cell gets a terrain class; speed / energy per class are looked up once into
+# per-cell arrays so the movement code only does array gathers
+# rollers cannot cross a gap, the vine can grow over it
+
+TERRAIN_CLASSES = ['flat', 'rubble', 'incline', 'gap']
+
+# per class, in TERRAIN_CLASSES order
+ROLLER_SPEED  = np.array([1.0, 0.5, 0.7, 0.0])   # cells per step
+ROLLER_ENERGY = np.array([1.0, 2.5, 1.8, 0.0])   # effort per cell traveled, flat = 1
+VINE_SPEED    = np.array([1.0, 0.8, 0.9, 1.0])
+VINE_ENERGY   = np.array([1.0, 1.5, 1.4, 1.2])
+
+
+def terrain_index(terrain_class):
+    if isinstance(terrain_class, str):
+        return TERRAIN_CLASSES.index(terrain_class)
+    return int(terrain_class)
+
+def create_terrain(floor_plan, zones=()):
+    # zones: (y, x, width, height, terrain class) like the wall tuples in cnst.MAP
+    classes = np.zeros(np.shape(floor_plan), dtype=np.int8)
+    for y_start, x_start, width, height, terrain_class in zones:
+        classes[x_start:x_start + height, y_start:y_start + width] = terrain_index(terrain_class)
+
+    return {
+        'classes': classes,
+        'roller_speed': ROLLER_SPEED[classes],
+        'roller_cost': ROLLER_ENERGY[classes],
+        'vine_speed': VINE_SPEED[classes],
+        'vine_cost': VINE_ENERGY[classes],
+    }
+
+def lookup(table, positions):
+    # gather per-cell values at continuous positions, rounded the way the robots round
+    positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+    int_x = np.clip(np.rint(positions[:, 0]).astype(int), 0, table.shape[0] - 1)
+    int_y = np.clip(np.rint(positions[:, 1]).astype(int), 0, table.shape[1] - 1)
+    return table[int_x, int_y]
+
+def random_terrain_zones(grid_size, seed=0, n_zones=10, size=(5, 20), classes=('rubble', 'incline', 'gap')):
+    rng = np.random.default_rng(seed)
+    n_x, n_y = grid_size
+    width = rng.integers(size[0], size[1] + 1, size=n_zones)
+    height = rng.integers(size[0], size[1] + 1, size=n_zones)
+    y = rng.integers(0, np.maximum(n_y - width, 0) + 1)
+    x = rng.integers(0, np.maximum(n_x - height, 0) + 1)
+    kind = rng.choice(list(classes), size=n_zones)
+    return [(int(y[i]), int(x[i]), int(width[i]), int(height[i]), str(kind[i])) for i in range(n_zones)]
@@ -0,0 +1,6 @@
+from backend_diff import run_harness
+
+
+def test_backends_match_reference():
+    report = run_harness(n_maps=2)
+    assert report['failures'] == []
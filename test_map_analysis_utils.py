@@ -0,0 +1,55 @@
+import numpy as np
+
+from map_analysis_utils import analyze_map
+
+
+def walled_room(shape=(40, 60), thickness=2):
+    floor_plan = np.ones(shape)
+    floor_plan[:thickness] = floor_plan[-thickness:] = 0
+    floor_plan[:, :thickness] = floor_plan[:, -thickness:] = 0
+    return floor_plan
+
+def two_rooms(door, thickness=2):
+    # a wall across the middle with one door of door cells
+    floor_plan = walled_room(thickness=thickness)
+    floor_plan[:, 30:30 + thickness] = 0
+    floor_plan[15:15 + door, 30:30 + thickness] = 1
+    return floor_plan
+
+def test_empty_map_has_no_gaps():
+    for floor_plan in (np.ones((40, 60)), walled_room()):
+        stats = analyze_map(floor_plan)
+        assert stats['n_gaps'] == 0
+        assert np.isnan(stats['min_aperture'])
+
+def test_single_door_width():
+    for door in (3, 4, 6):
+        stats = analyze_map(two_rooms(door))
+        assert stats['n_gaps'] == 1
+        assert stats['min_aperture'] == door
+
+def test_door_in_thin_wall():
+    stats = analyze_map(two_rooms(4, thickness=1))
+    assert stats['n_gaps'] == 1
+    assert stats['min_aperture'] == 4
+
+def test_door_along_y():
+    stats = analyze_map(two_rooms(5).T)
+    assert stats['n_gaps'] == 1
+    assert stats['min_aperture'] == 5
+
+def test_door_against_room_corner():
+    floor_plan = two_rooms(4)
+    floor_plan[15:19, 30:32] = 0
+    floor_plan[2:6, 30:32] = 1
+    stats = analyze_map(floor_plan)
+    assert stats['n_gaps'] == 1
+    assert stats['min_aperture'] == 4
+
+def test_gap_between_rubble():
+    floor_plan = walled_room()
+    floor_plan[15:20, 20:25] = 0
+    floor_plan[15:20, 28:33] = 0
+    stats = analyze_map(floor_plan)
+    assert stats['n_gaps'] == 1
+    assert stats['min_aperture'] == 3
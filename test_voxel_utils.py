@@ -0,0 +1,59 @@
+import numpy as np
+
+from voxel_utils import extrude_levels, get_voxels, set_voxels, fill_box, store_bytes
+
+
+def floor_plan(seed, shape=(200, 300)):
+    # rooms every 40 cells with doors, and scattered rubble so most chunks hold some wall
+    rng = np.random.default_rng(seed)
+    plan = np.ones(shape)
+    plan[:2] = plan[-2:] = 0
+    plan[:, :2] = plan[:, -2:] = 0
+    plan[40::40, :] = 0
+    plan[:, 40::40] = 0
+    plan[40::40, 15:20] = 1
+    plan[15:20, 40::40] = 1
+    x, y = rng.integers(0, shape[0] - 3, 400), rng.integers(0, shape[1] - 3, 400)
+    for dx in range(3):
+        for dy in range(3):
+            plan[x + dx, y + dy] = 0
+    return plan
+
+def dense_site(plans, level_height, openings):
+    volume = np.ones(plans[0].shape + (len(plans) * level_height,), dtype=np.int8)
+    for level, plan in enumerate(plans):
+        z0 = level * level_height
+        volume[:, :, z0] = 0
+        for x0, y0, x1, y1 in openings.get(level, []):
+            volume[x0:x1, y0:y1, z0] = 1
+        volume[:, :, z0 + 1:z0 + level_height][plan == 0] = 0
+    return volume
+
+def all_voxels(store):
+    return get_voxels(store, tuple(np.indices(store['shape']).reshape(3, -1))).reshape(store['shape'])
+
+def test_extruded_site_matches_dense_and_is_smaller():
+    plans = [floor_plan(seed) for seed in range(3)]
+    openings = {1: [(20, 20, 30, 30)]}
+    for level_height in (6, 12):
+        env = extrude_levels(plans, level_height=level_height, openings=openings)
+        dense = dense_site(plans, level_height, openings)
+        assert np.array_equal(all_voxels(env), dense)
+        assert store_bytes(env) < dense.nbytes / 4
+
+def test_writes_into_shared_chunks_are_copied():
+    plans = [floor_plan(0, shape=(60, 80))]
+    env = extrude_levels(plans, level_height=6)
+    dense = all_voxels(env).copy()
+    rng = np.random.default_rng(1)
+    for _ in range(20):
+        lo = rng.integers(0, env['shape'])
+        hi = lo + rng.integers(1, 40, 3)
+        value = rng.integers(0, 2)
+        fill_box(env, lo, hi, value)
+        dense[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]] = value
+        coords = tuple(rng.integers(0, size, 100) for size in env['shape'])
+        values = rng.integers(0, 2, 100).astype(np.int8)
+        set_voxels(env, coords, values)
+        dense[coords] = values
+    assert np.array_equal(all_voxels(env), dense)
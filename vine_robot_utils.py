@@ -1,13 +1,23 @@
 import numpy as np
+import cnst
 
-def move_vine_robot(vine_robot, floor_plan):
+from robot_utils import check_collision, create_robot
+from terrain_utils import lookup
+
+def move_vine_robot(vine_robot, floor_plan, terrain=None):
     if not vine_robot['active']: return
 
     x, y = vine_robot['positions'][-1]
     orientation = vine_robot['orientation']
+
+    # growth per step and effort per cell from the terrain under the tip
+    speed, cost = 1.0, 1.0
+    if terrain is not None:
+        speed = lookup(terrain['vine_speed'], (x, y))[0]
+        cost = lookup(terrain['vine_cost'], (x, y))[0]
     
-    new_x = x + np.cos(orientation)
-    new_y = y + np.sin(orientation)
+    new_x = x + speed * np.cos(orientation)
+    new_y = y + speed * np.sin(orientation)
     int_new_x, int_new_y = int(round(new_x)), int(round(new_y))
 
     # check if not blocked
@@ -16,6 +26,26 @@ def move_vine_robot(vine_robot, floor_plan):
         and floor_plan[int_new_x, int_new_y] == 1):
         
         vine_robot['positions'].append((new_x, new_y))
+        vine_robot['effort'] = vine_robot.get('effort', 0.0) + speed * cost
     else:
         vine_robot['active'] = False
-        print("Vine robot reached a wall and stopped moving.")
\ No newline at end of file
+        print("Vine robot reached a wall and stopped moving.")
+
+def deploy_from_vine(vine_robot, robots, floor_plan, sensors, offset_distance=2):
+    # drop a rescue roller just ahead of the vine tip, returns None if blocked
+    tip_x, tip_y = vine_robot['positions'][-1]
+    orientation = vine_robot['orientation']
+    new_x = tip_x + offset_distance * np.cos(orientation)
+    new_y = tip_y + offset_distance * np.sin(orientation)
+    new_position = (new_x, new_y)
+    int_x, int_y = int(round(new_x)), int(round(new_y))
+
+    if not (0 <= int_x < floor_plan.shape[0]
+            and 0 <= int_y < floor_plan.shape[1]
+            and floor_plan[int_x, int_y] == 1
+            and not check_collision(new_position, None, robots, floor_plan, cnst.ROBOT_DIAM)):
+        return None
+
+    robot = create_robot(new_position, np.random.uniform(0, 2 * np.pi), sensors)
+    robots.append(robot)
+    return robot
@@ -0,0 +1,276 @@
+import numpy as np
+import cnst
+
+from batch_utils import wall_collisions, cast_rays
+
+# optional 3D mode for multi-level collapse sites (README item 2: vertical and horizontal coverage)
+# voxels live in a chunked store: a small (chunks_x, chunks_y, chunks_z) table either points a
+# chunk at a slot of a pool of blocks or, for a chunk that is all one value, holds that value
+# itself (as -2 - value), so untouched space, whole floor slabs and open air cost one table
+# entry each; slots are reference counted and copied on write, so the wall layers of a level,
+# which are all the same, share one set of blocks; chunks are flat in z for that reason
+# the environment defaults to free (1), 0 is solid, the known map defaults to unknown (-1)
+# lookups are one gather, so the batch_utils kernels (cast_rays, wall_collisions) run on it
+# unchanged through voxel_lookup; coordinates are (x, y, z) with z up
+
+CHUNK = (16, 16, 1)
+
+
+def uniform_code(value):
+    return -2 - np.asarray(value, dtype=np.int32)
+
+def create_voxel_store(shape, default, chunk=CHUNK, capacity=16):
+    chunk = tuple(chunk) if np.ndim(chunk) else (chunk,) * 3
+    n_chunks = tuple(-(-size // c) for size, c in zip(shape, chunk))
+    return {
+        'shape': tuple(shape),
+        'chunk': chunk,
+        'default': default,
+        'n_chunks': n_chunks,
+        'table': np.full(n_chunks, uniform_code(default), dtype=np.int32),  # slot, or -2 - value
+        'pool': np.zeros((capacity,) + chunk, dtype=np.int8),
+        'refs': np.zeros(capacity, dtype=np.int32),  # chunks pointing at each slot
+        'n_slots': 0,
+        'free_slots': [],
+    }
+
+def split(store, coords):
+    # per-axis index arrays -> flat chunk ids and in-chunk offsets
+    chunk = store['chunk']
+    chunk_ids = np.ravel_multi_index(tuple(c // size for c, size in zip(coords, chunk)), store['n_chunks'])
+    return chunk_ids, tuple(c % size for c, size in zip(coords, chunk))
+
+def take_slots(store, n):
+    # n unused slots, freed ones first, growing the pool by doubling
+    reused = store['free_slots'][:n]
+    del store['free_slots'][:n]
+    start, end = store['n_slots'], store['n_slots'] + n - len(reused)
+    if end > len(store['pool']):
+        capacity = max(end, 2 * len(store['pool']))
+        pool = np.zeros((capacity,) + store['pool'].shape[1:], dtype=np.int8)
+        pool[:start] = store['pool'][:start]
+        refs = np.zeros(capacity, dtype=np.int32)
+        refs[:start] = store['refs'][:start]
+        store['pool'], store['refs'] = pool, refs
+    store['n_slots'] = end
+    return np.concatenate([np.array(reused, dtype=np.int64), np.arange(start, end)])
+
+def release(store, slots):
+    np.subtract.at(store['refs'], slots, 1)
+    store['free_slots'] += np.unique(slots[store['refs'][slots] == 0]).tolist()
+
+def allocate(store, chunk_ids):
+    # give every chunk a slot of its own before it is written: uniform chunks get one filled
+    # with their value, chunks sharing a slot get a copy
+    table = store['table'].reshape(-1)
+    chunk_ids = np.unique(chunk_ids)
+    codes = table[chunk_ids]
+    own = chunk_ids[(codes < 0) | (store['refs'][np.maximum(codes, 0)] > 1)]
+    if len(own) == 0:
+        return
+    old = table[own]
+    slots = take_slots(store, len(own))
+    shared = old >= 0
+    store['pool'][slots[~shared]] = (-2 - old[~shared]).astype(np.int8)[:, None, None, None]
+    store['pool'][slots[shared]] = store['pool'][old[shared]]
+    release(store, old[shared])
+    table[own] = slots
+    store['refs'][slots] = 1
+
+def set_uniform(store, chunk_ids, value):
+    # whole chunks to one value, dropping their slots
+    table = store['table'].reshape(-1)
+    slots = table[chunk_ids]
+    release(store, slots[slots >= 0])
+    table[chunk_ids] = uniform_code(value)
+
+def share_chunks(store, src_ids, dst_ids):
+    # dst chunks take the contents of src chunks without copying, until one of them is written
+    table = store['table'].reshape(-1)
+    codes, old = table[src_ids], table[dst_ids]
+    np.add.at(store['refs'], codes[codes >= 0], 1)
+    table[dst_ids] = codes
+    release(store, old[old >= 0])
+
+def layer_chunks(store, z):
+    # flat ids of the chunks holding voxel layer z
+    n_cx, n_cy, _ = store['n_chunks']
+    grid = np.meshgrid(np.arange(n_cx), np.arange(n_cy), [z // store['chunk'][2]], indexing='ij')
+    return np.ravel_multi_index(tuple(grid), store['n_chunks']).reshape(-1)
+
+def get_voxels(store, coords):
+    # coords: tuple of per-axis in-bounds index arrays, any (matching) shape
+    chunk_ids, local = split(store, coords)
+    codes = store['table'].reshape(-1)[chunk_ids]
+    values = store['pool'][(np.maximum(codes, 0),) + local]
+    return np.where(codes >= 0, values, (-2 - codes).astype(np.int8))
+
+def set_voxels(store, coords, values):
+    coords = tuple(np.asarray(c).reshape(-1) for c in coords)
+    values = np.broadcast_to(np.asarray(values, dtype=np.int8).reshape(-1), coords[0].shape)
+    chunk_ids, local = split(store, coords)
+    # writing a uniform chunk's own value changes nothing, so it stays uniform
+    change = store['table'].reshape(-1)[chunk_ids] != uniform_code(values)
+    chunk_ids, local, values = chunk_ids[change], tuple(c[change] for c in local), values[change]
+    allocate(store, chunk_ids)
+    store['pool'][(store['table'].reshape(-1)[chunk_ids],) + local] = values
+
+def fill_box(store, lo, hi, value):
+    # voxels lo <= v < hi, clipped to the volume; chunks the box covers whole become uniform,
+    # only the ragged edges are written voxel by voxel
+    shape, chunk = np.array(store['shape']), np.array(store['chunk'])
+    lo = np.maximum(lo, 0)
+    hi = np.minimum(hi, shape)
+    if np.any(hi <= lo):
+        return
+    inner_lo = -(-lo // chunk)
+    inner_hi = np.where(hi == shape, store['n_chunks'], hi // chunk)
+    coords = np.meshgrid(*(np.arange(a, b) for a, b in zip(lo, hi)), indexing='ij')
+    if np.all(inner_hi > inner_lo):
+        inner = np.meshgrid(*(np.arange(a, b) for a, b in zip(inner_lo, inner_hi)), indexing='ij')
+        set_uniform(store, np.ravel_multi_index(tuple(inner), store['n_chunks']).reshape(-1), value)
+        covered = np.all([(c // size >= a) & (c // size < b) for c, size, a, b in zip(coords, chunk, inner_lo, inner_hi)], axis=0)
+        coords = [c[~covered] for c in coords]
+    set_voxels(store, coords, value)
+
+def voxel_lookup(store):
+    # is_wall for batch_utils, rows are ignored since there is one volume
+    def is_wall(coords, rows):
+        return get_voxels(store, tuple(coords)) == 0
+    return is_wall
+
+def store_bytes(store):
+    return store['table'].nbytes + (store['n_slots'] - len(store['free_slots'])) * store['pool'][0].nbytes
+
+def chunk_blocks(store):
+    # (x, y, z) origin and values, clipped to the volume, of every chunk that is not all default
+    chunk, shape = np.array(store['chunk']), np.array(store['shape'])
+    table = store['table'].reshape(-1)
+    for c in np.flatnonzero(table != uniform_code(store['default'])):
+        origin = np.array(np.unravel_index(c, store['n_chunks'])) * chunk
+        size = tuple(np.minimum(origin + chunk, shape) - origin)
+        if table[c] >= 0:
+            block = store['pool'][table[c]][:size[0], :size[1], :size[2]]
+        else:
+            block = np.broadcast_to(np.int8(-2 - table[c]), size)
+        yield origin, block
+
+def extrude_levels(floor_plans, level_height=6, slab=1, openings=None, chunk=CHUNK):
+    # stack 2D floor plans into a multi-level site: each level's walls rise level_height voxels
+    # above a solid slab; openings[level] = [(x0, y0, x1, y1), ...] holes cut into its slab
+    floor_plans = [np.asarray(floor_plan) for floor_plan in floor_plans]
+    n_x, n_y = floor_plans[0].shape
+    env = create_voxel_store((n_x, n_y, len(floor_plans) * level_height), default=1, chunk=chunk)
+    for level, floor_plan in enumerate(floor_plans):
+        z0 = level * level_height
+        fill_box(env, (0, 0, z0), (n_x, n_y, z0 + slab), 0)
+        for x0, y0, x1, y1 in (openings or {}).get(level, []):
+            fill_box(env, (x0, y0, z0), (x1, y1, z0 + slab), 1)
+        # walls are the same in every layer of a level: write the first layer, share it upwards
+        wall_x, wall_y = np.nonzero(floor_plan == 0)
+        z1 = z0 + slab
+        set_voxels(env, (wall_x, wall_y, np.full(len(wall_x), z1)), 0)
+        for z in range(z1 + 1, z0 + level_height):
+            if env['chunk'][2] == 1:
+                share_chunks(env, layer_chunks(env, z1), layer_chunks(env, z))
+            else:
+                set_voxels(env, (wall_x, wall_y, np.full(len(wall_x), z)), 0)
+    return env
+
+def cone_directions_3d(yaws, pitches, cone_angle=None, n_yaw=16, n_pitch=8):
+    # (M, n_yaw * n_pitch, 3) unit rays spread over the cone angle in yaw and in pitch
+    cone_angle = cnst.CONE_ANGLE if cone_angle is None else cone_angle
+    offsets = np.linspace(-cone_angle / 2, cone_angle / 2, n_yaw) if n_yaw > 1 else np.zeros(1)
+    lifts = np.linspace(-cone_angle / 2, cone_angle / 2, n_pitch) if n_pitch > 1 else np.zeros(1)
+    yaw = (np.asarray(yaws)[:, None, None] + offsets[None, :, None]).repeat(n_pitch, axis=2)
+    pitch = (np.asarray(pitches)[:, None, None] + lifts[None, None, :]).repeat(n_yaw, axis=1)
+    directions = np.stack([np.cos(pitch) * np.cos(yaw), np.cos(pitch) * np.sin(yaw), np.sin(pitch)], axis=-1)
+    return directions.reshape(len(yaws), -1, 3)
+
+def sense_voxels(positions, yaws, pitches, env, known, cone_length=None, n_yaw=16, n_pitch=8, n_steps=None):
+    # 3D cone vision into the known store, returns the number of newly known voxels
+    cone_length = cnst.CONE_LENGTH if cone_length is None else cone_length
+    n_steps = 2 * int(np.ceil(cone_length)) if n_steps is None else n_steps
+    positions = np.asarray(positions, dtype=float)
+    directions = cone_directions_3d(yaws, pitches, n_yaw=n_yaw, n_pitch=n_pitch)
+    distances = np.linspace(0.5, cone_length, n_steps)
+    _, cells, seen, wall = cast_rays(positions, directions, distances, env['shape'], voxel_lookup(env))
+
+    coords = tuple(c[seen] for c in cells)
+    _, first = np.unique(np.ravel_multi_index(coords, env['shape']), return_index=True)
+    coords = tuple(c[first] for c in coords)
+    new = get_voxels(known, coords) == -1
+    set_voxels(known, tuple(c[new] for c in coords), np.where(wall[seen][first][new], 0, 1))
+    return int(np.count_nonzero(new))
+
+def voxel_collisions(positions, env, robot_diameter=None):
+    # check_collision in 3D: a solid voxel centre inside the robot's sphere, or leaving the volume
+    robot_diameter = cnst.ROBOT_DIAM if robot_diameter is None else robot_diameter
+    return wall_collisions(np.asarray(positions, dtype=float), robot_diameter / 2, env['shape'], voxel_lookup(env))
+
+def move_rollers_3d(positions, orientations, env, rng, robot_diameter=None, max_climb=1):
+    # move_robot on voxels: forward (with jitter) or the first free bump turn, climbing up to
+    # max_climb voxels onto steps and inclines, then falling until supported
+    # robots move in list order and see the moves of the ones before them
+    robot_diameter = cnst.ROBOT_DIAM if robot_diameter is None else robot_diameter
+    positions = np.array(positions, dtype=float)
+    orientations = (np.asarray(orientations, dtype=float)
+                    + rng.uniform(-np.pi / 18, np.pi / 18, size=len(positions))) % (2 * np.pi)
+    moved = np.zeros(len(positions), dtype=bool)
+    bumps = np.array([np.pi / 2, -np.pi / 2, np.pi])
+
+    for i in range(len(positions)):
+        headings = np.concatenate([[orientations[i]], (orientations[i] + rng.permutation(bumps)) % (2 * np.pi)])
+        # candidates ordered heading first, then climb height
+        steps = np.stack([np.cos(headings), np.sin(headings), np.zeros(4)], axis=-1)
+        climbs = np.arange(max_climb + 1)
+        targets = (positions[i] + steps[:, None, :] + np.stack([0 * climbs, 0 * climbs, climbs], axis=-1)[None]).reshape(-1, 3)
+
+        others = np.delete(positions, i, axis=0)
+        free = ~voxel_collisions(targets, env, robot_diameter)
+        if len(others):
+            free &= ~np.any(np.sqrt(np.sum((targets[:, None, :] - others[None]) ** 2, axis=-1)) < robot_diameter, axis=1)
+        if free.any():
+            k = int(np.argmax(free))
+            positions[i] = targets[k]
+            orientations[i] = headings[k // len(climbs)]
+            moved[i] = True
+
+    settle(positions, env, robot_diameter)
+    return positions, orientations, moved
+
+def settle(positions, env, robot_diameter=None):
+    # gravity: lower every robot one voxel at a time while the spot below is clear
+    falling = np.arange(len(positions))
+    while len(falling):
+        below = positions[falling] - [0, 0, 1]
+        ok = ~voxel_collisions(below, env, robot_diameter)
+        falling = falling[ok]
+        positions[falling] = below[ok]
+    return positions
+
+def voxel_coverage(known, env, level_height=None):
+    # known free voxels over free voxels, overall and per level, plus the share of (x, y)
+    # columns with anything known in them (horizontal coverage)
+    n_x, n_y, n_z = env['shape']
+    z_free = np.full(n_z, n_x * n_y)
+    z_known = np.zeros(n_z, dtype=int)
+    columns = np.zeros((n_x, n_y), dtype=bool)
+
+    for (x, y, z), block in chunk_blocks(env):
+        z_free[z:z + block.shape[2]] -= np.count_nonzero(block == 0, axis=(0, 1))
+    for (x, y, z), block in chunk_blocks(known):
+        z_known[z:z + block.shape[2]] += np.count_nonzero(block == 1, axis=(0, 1))
+        columns[x:x + block.shape[0], y:y + block.shape[1]] |= np.any(block != -1, axis=2)
+
+    results = {
+        'volume_coverage': float(z_known.sum() / z_free.sum()) if z_free.sum() else 0.0,
+        'horizontal_coverage': float(columns.mean()),
+        'known_bytes': store_bytes(known),
+        'env_bytes': store_bytes(env),
+    }
+    if level_height is not None:
+        levels = range(0, n_z, level_height)
+        results['level_coverage'] = [float(z_known[z:z + level_height].sum() / max(z_free[z:z + level_height].sum(), 1))
+                                     for z in levels]
+    return results